@@ -0,0 +1,26 @@
+import asyncio
+from config import config
+from metrics import metrics
+
+
+class AsyncAIClient:
+    # Chat completions through AsyncOpenAI, with a cap on calls in flight and a timeout on
+    # each one, so a slow model never blocks the event loop or piles up unbounded requests.
+    def __init__(self, openai_client, max_concurrency=config.OPENAI_MAX_CONCURRENCY, timeout=config.OPENAI_TIMEOUT):
+        self.openai_client = openai_client
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.timeout = timeout
+
+    async def complete(self, model, messages, timeout=None):
+        async with self.semaphore:
+            with metrics.timer('bot_external_call', service='openai', operation='chat'):
+                return await self.openai_client.chat.completions.create(model=model, messages=messages, timeout=timeout or self.timeout)
+
+    async def stream(self, model, messages, timeout=None):
+        # Yields pieces of the reply text as they arrive
+        async with self.semaphore:
+            with metrics.timer('bot_external_call', service='openai', operation='chat_stream'):
+                stream = await self.openai_client.chat.completions.create(model=model, messages=messages, stream=True, timeout=timeout or self.timeout)
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
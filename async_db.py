@@ -0,0 +1,97 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from config import config
+import database_setup
+import functools
+from metrics import metrics
+
+
+class AsyncDatabase:
+    # The SQLAlchemy helpers in database_setup are blocking, so the bot awaits them on a
+    # small dedicated thread pool instead of running them on the event loop.
+    def __init__(self, max_workers=config.DB_MAX_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db')
+
+    async def run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        with metrics.timer('bot_external_call', service='sqlite', operation=func.__name__):
+            return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def initialize(self):
+        return await self.run(database_setup.initialize_database)
+
+    async def fetch_all_tokens(self):
+        return await self.run(database_setup.fetch_all_tokens)
+
+    async def add_playlist_to_db(self, playlist_id, name, description, playlist_url, user_id):
+        return await self.run(database_setup.add_playlist_to_db, playlist_id, name, description, playlist_url, user_id)
+
+    async def fetch_all_playlists_from_db(self):
+        return await self.run(database_setup.fetch_all_playlists_from_db)
+
+    async def get_all_playlists(self):
+        rows = database_setup.playlist_rows
+        if rows is None:
+            rows, _ = await self.run(database_setup.load_playlist_name_index)
+        return rows
+
+    async def get_playlist_name_index(self):
+        index = database_setup.playlist_name_index
+        if index is None:
+            _, index = await self.run(database_setup.load_playlist_name_index)
+        return index
+
+    async def get_playlist_by_name(self, name):
+        index = await self.get_playlist_name_index()
+        return index.get(name.casefold())
+
+    async def save_music_profile(self, user_id, profile):
+        return await self.run(database_setup.save_music_profile, user_id, profile)
+
+    async def get_music_profile(self, user_id):
+        return await self.run(database_setup.get_music_profile, user_id)
+
+    async def add_recommendation(self, user_id, recommendation_type, recommendation):
+        return await self.run(database_setup.add_recommendation, user_id, recommendation_type, recommendation)
+
+    async def get_recommendations(self, user_id, recommendation_type):
+        return await self.run(database_setup.get_recommendations, user_id, recommendation_type)
+
+    async def save_search_result(self, cache_key, results, fetched_at):
+        return await self.run(database_setup.save_search_result, cache_key, results, fetched_at)
+
+    async def load_search_results(self, since, limit):
+        return await self.run(database_setup.load_search_results, since, limit)
+
+    async def add_trivia_question(self, question_key, question, options, answer):
+        return await self.run(database_setup.add_trivia_question, question_key, question, options, answer)
+
+    async def count_unused_trivia_questions(self):
+        return await self.run(database_setup.count_unused_trivia_questions)
+
+    async def take_trivia_question(self):
+        return await self.run(database_setup.take_trivia_question)
+
+    async def get_job_last_run(self, name):
+        return await self.run(database_setup.get_job_last_run, name)
+
+    async def save_job_last_run(self, name, last_run_at):
+        return await self.run(database_setup.save_job_last_run, name, last_run_at)
+
+    async def save_dm_session(self, user_id, state, data, profile, touched_at):
+        return await self.run(database_setup.save_dm_session, user_id, state, data, profile, touched_at)
+
+    async def delete_dm_session(self, user_id):
+        return await self.run(database_setup.delete_dm_session, user_id)
+
+    async def get_dm_session(self, user_id, since):
+        return await self.run(database_setup.get_dm_session, user_id, since)
+
+    async def load_dm_sessions(self, since, limit):
+        return await self.run(database_setup.load_dm_sessions, since, limit)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+db = AsyncDatabase()
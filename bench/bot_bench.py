@@ -0,0 +1,271 @@
+# End-to-end benchmarks of ModBot/SpotifyBot handlers without Discord, Spotify or OpenAI
+# credentials. The bot runs against local stand-ins (bench/stubs.py) and fake Discord
+# objects (bench/fakes.py) in a throwaway working directory, and each run appends its
+# parameters and results to bench_output.txt so runs can be compared.
+#
+#   python bench/bot_bench.py
+#   python bench/bot_bench.py --scenarios listening --members 1000 10000
+#   python bench/bot_bench.py --latency 0.1 --rate-limit 0.05 --retry-after 1
+import argparse
+import asyncio
+import contextlib
+from datetime import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+SCENARIOS = ['on_message', 'listening', 'discover', 'refresh_storm']
+GUILD_ID = 1
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def latency_summary(seconds):
+    ms = [value * 1000 for value in seconds]
+    return f"p50={percentile(ms, 0.5):.1f}ms p95={percentile(ms, 0.95):.1f}ms max={max(ms, default=0):.1f}ms"
+
+
+class Bench:
+    def __init__(self, args, output):
+        self.args = args
+        self.output = output
+
+    def report(self, line):
+        # stdout is silenced while the bot runs, so results go straight to the terminal
+        print(line, file=sys.__stdout__, flush=True)
+        self.output.write(line + '\n')
+
+    def setup_environment(self):
+        from config import config
+        from stubs import OpenAIHandler, SpotifyHandler, StubServer
+
+        # bot.py, flash_server and database_setup read tokens.json and the database from the
+        # working directory, so give them a scratch one
+        self.workdir = tempfile.mkdtemp(prefix='tunein_bot_bench_')
+        os.chdir(self.workdir)
+        with open('tokens.json', 'w') as f:
+            json.dump({
+                'discord': 'bench', 'discord_guild': GUILD_ID, 'openai': 'bench',
+                'spotify_client_id': 'bench', 'spotify_client_secret': 'bench',
+                'spotify_redirect_uri': 'http://127.0.0.1/callback',
+            }, f)
+
+        stub_options = dict(latency=self.args.latency, jitter=self.args.jitter,
+                            rate_limit_ratio=self.args.rate_limit, retry_after=self.args.retry_after)
+        self.spotify = StubServer(SpotifyHandler, **stub_options).start()
+        OpenAIHandler.chunks = self.args.chunks
+        OpenAIHandler.chunk_delay = self.args.chunk_delay
+        self.openai = StubServer(OpenAIHandler, **stub_options).start()
+
+        config.SPOTIFY_API_URL = f'{self.spotify.url}/v1/'
+        config.AUTH_SERVER_URL = self.spotify.url
+        config.OPENAI_BASE_URL = f'{self.openai.url}/v1'
+        config.LOG_CONSOLE = False
+
+    async def setup_bot(self):
+        import bot
+        from async_db import db
+        import database_setup
+
+        self.bot = bot
+        self.db = db
+        self.client = bot.ModBot()
+        self.spotify_bot = self.client.spotify_bot
+        await db.initialize()
+        self.client.moderation.start()
+        await self.client.sessions.load()
+
+        # Every member that might be polled has a token; bulk insert instead of one write each
+        session = database_setup.get_session()
+        expires_at = int(time.time()) + 3600
+        session.add_all(database_setup.SpotifyToken(
+            user_id=str(self.member_id(n)), access_token=f'token-{n}', refresh_token=f'refresh-{n}',
+            token_type='Bearer', expires_in=3600, scope='', expires_at=expires_at
+        ) for n in range(max(self.args.members)))
+        session.commit()
+        session.close()
+        await self.spotify_bot.token_store.load()
+        await self.spotify_bot.setup_spotify_commands()
+
+    def member_id(self, n):
+        return 10 ** 17 + n
+
+    def command(self, name):
+        import discord
+        return self.client.tree.get_command(name, guild=discord.Object(id=GUILD_ID))
+
+    def guild(self, size, presence_ratio=0.0):
+        from fakes import FakeGuild, FakeMember, spotify_activity
+        presence_every = round(1 / presence_ratio) if presence_ratio else 0
+        members = [
+            FakeMember(self.member_id(n), [spotify_activity(n)] if presence_every and n % presence_every == 0 else [])
+            for n in range(size)
+        ]
+        return FakeGuild(members)
+
+    async def run_on_message(self):
+        from fakes import FakeChannel, FakeMessage
+        guild = self.guild(min(self.args.members))
+        channel = FakeChannel()
+        common = ['lol', 'nice', 'what song is this?', 'good morning', 'gg']
+        messages = []
+        for n in range(self.args.messages):
+            author = guild.members[n % len(guild.members)]
+            if n % 100 == 0:
+                content = f'flagme message {n}'
+            elif n % 5 == 0:
+                content = common[n % len(common)]
+            else:
+                content = f'message {n} about {n % 37} songs'
+            messages.append(FakeMessage(content, author=author, channel=channel, guild=guild))
+
+        latencies = []
+
+        async def handle(message):
+            started = time.perf_counter()
+            await self.client.on_message(message)
+            latencies.append(time.perf_counter() - started)
+
+        self.openai.reset_counts()
+        started = time.perf_counter()
+        # discord.py dispatches every event as its own task, so they all run concurrently
+        await asyncio.gather(*(handle(message) for message in messages))
+        elapsed = time.perf_counter() - started
+        moderation = self.client.moderation.stats()
+        self.report(f"on_message messages={len(messages)} wall={elapsed:.2f}s throughput={len(messages) / elapsed:.0f}/s "
+                    f"{latency_summary(latencies)} moderation_requests={self.openai.requests.get('/v1/moderations', 0)} "
+                    f"batches={moderation.get('batches_sent')} cache_hit_rate={moderation['cache']['hit_rate']:.2f} "
+                    f"deleted={sum(message.deleted for message in messages)}")
+
+    async def run_listening(self):
+        from fakes import FakeInteraction
+        command = self.command('listening')
+        for size in self.args.members:
+            guild = self.guild(size, self.args.presence)
+            now_playing = self.spotify_bot.now_playing
+            now_playing.entries.clear()
+            for member in guild.members:
+                now_playing.update_from_member(member)
+            interaction = FakeInteraction(guild.members[0], guild, command)
+            self.spotify.reset_counts()
+            started = time.perf_counter()
+            await command.callback(interaction)
+            elapsed = time.perf_counter() - started
+            first_response = (interaction.first_response_at or time.perf_counter()) - interaction.started_at
+            self.report(f"listening members={size} presence={self.args.presence:.2f} first_response={first_response * 1000:.0f}ms "
+                        f"complete={elapsed:.2f}s edits={interaction.edits} spotify_requests={self.spotify.total_requests()} "
+                        f"rate_limited={self.spotify.rate_limited}")
+
+    async def run_discover(self):
+        from fakes import FakeInteraction
+        command = self.command('discover')
+        guild = self.guild(max(self.args.discover_concurrency))
+        profile = {'name': 'Bench', 'genres': 'indie, jazz', 'artists': 'Artist 1, Artist 2', 'song': 'Song 1',
+                   'events': 'none', 'top_songs': [f'Song {n} by Artist {n}' for n in range(5)],
+                   'top_artists': [f'Artist {n}' for n in range(5)]}
+        for member in guild.members:
+            await self.spotify_bot.profile_cache.save(member.id, profile)
+
+        for concurrency in self.args.discover_concurrency:
+            interactions = [FakeInteraction(member, guild, command) for member in guild.members[:concurrency]]
+            totals = []
+
+            async def invoke(interaction):
+                started = time.perf_counter()
+                await command.callback(interaction, 'song')
+                totals.append(time.perf_counter() - started)
+
+            self.openai.reset_counts()
+            started = time.perf_counter()
+            await asyncio.gather(*(invoke(interaction) for interaction in interactions))
+            elapsed = time.perf_counter() - started
+            first_chunk = [interaction.first_response_at - interaction.started_at for interaction in interactions if interaction.first_response_at]
+            self.report(f"discover concurrency={concurrency} wall={elapsed:.2f}s first_chunk {latency_summary(first_chunk)} "
+                        f"complete {latency_summary(totals)} openai_requests={self.openai.total_requests()} "
+                        f"rate_limited={self.openai.rate_limited}")
+
+    async def run_refresh_storm(self):
+        token_store = self.spotify_bot.token_store
+        users = [str(self.member_id(n)) for n in range(min(self.args.storm_users, max(self.args.members)))]
+        # Every token expires at once, and several handlers ask for each user's token together
+        expiring = int(time.time()) + 10
+        for user_id in users:
+            token_store.records[user_id].expires_at = expiring
+        latencies = []
+
+        async def fresh_token(user_id):
+            started = time.perf_counter()
+            token_info = await token_store.get(user_id)
+            token = await self.spotify_bot.get_fresh_token(token_info, user_id)
+            latencies.append(time.perf_counter() - started)
+            return token
+
+        self.spotify.reset_counts()
+        started = time.perf_counter()
+        tokens = await asyncio.gather(*(fresh_token(user_id) for user_id in users for _ in range(self.args.storm_callers)))
+        elapsed = time.perf_counter() - started
+        fresh = sum(1 for token in tokens if token and token.startswith('fresh-'))
+        self.report(f"refresh_storm users={len(users)} callers={len(tokens)} wall={elapsed:.2f}s {latency_summary(latencies)} "
+                    f"refresh_requests={self.spotify.requests.get('/refresh_token', 0)} fresh={fresh} "
+                    f"rate_limited={self.spotify.rate_limited}")
+
+    async def run(self):
+        await self.setup_bot()
+        try:
+            for scenario in self.args.scenarios:
+                await getattr(self, f'run_{scenario}')()
+            if self.args.metrics:
+                from metrics import metrics
+                for line in metrics.summary():
+                    self.report(f"  {line}")
+        finally:
+            self.client.moderation.stop()
+            self.spotify_bot.spotify_client.close()
+            self.db.close()
+            self.spotify.stop()
+            self.openai.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--members', type=int, nargs='+', default=[1000, 10000], help='guild sizes for /listening')
+    parser.add_argument('--presence', type=float, default=0.3, help='share of members with a Spotify presence')
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--discover-concurrency', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--storm-users', type=int, default=500)
+    parser.add_argument('--storm-callers', type=int, default=4, help='concurrent token lookups per user')
+    parser.add_argument('--latency', type=float, default=0.05, help='stub response latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.02)
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='share of stub responses that are 429s')
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--chunks', type=int, default=12, help='chunks per streamed OpenAI reply')
+    parser.add_argument('--chunk-delay', type=float, default=0.02)
+    parser.add_argument('--metrics', action='store_true', help='append the bot metrics summary')
+    parser.add_argument('--output', default=os.path.join(REPO_DIR, 'bench_output.txt'))
+    args = parser.parse_args()
+
+    with open(args.output, 'a') as output:
+        bench = Bench(args, output)
+        bench.report(f"# {datetime.now().isoformat(timespec='seconds')} latency={args.latency}s jitter={args.jitter}s "
+                     f"rate_limit={args.rate_limit} retry_after={args.retry_after}s python={sys.version.split()[0]}")
+        bench.setup_environment()
+        # The bot prints freely; keep that out of the results
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            asyncio.run(bench.run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# Recommendation lookup latency as the table grows, with and without the
+# (user_id, recommendation_type) index. Runs against a throwaway database.
+#
+#   python bench/db_bench.py --sizes 10000 100000 1000000
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+RECOMMENDATION_TYPES = ['song', 'album', 'artist', 'random']
+
+
+def populate(engine, table, start, stop, users):
+    from sqlalchemy import insert
+    batch_size = 50000
+    with engine.begin() as conn:
+        for batch_start in range(start, stop, batch_size):
+            rows = [{
+                'user_id': str(random.randrange(users)),
+                'recommendation_type': random.choice(RECOMMENDATION_TYPES),
+                'recommendation': f"Song {n} by Artist {n % 997}"
+            } for n in range(batch_start, min(batch_start + batch_size, stop))]
+            conn.execute(insert(table), rows)
+
+
+def time_queries(session_factory, model, users, queries):
+    latencies = []
+    for _ in range(queries):
+        user_id = str(random.randrange(users))
+        recommendation_type = random.choice(RECOMMENDATION_TYPES)
+        session = session_factory()
+        started = time.perf_counter()
+        recommendations = session.query(model).filter_by(user_id=user_id, recommendation_type=recommendation_type).all()
+        [rec.recommendation for rec in recommendations]
+        latencies.append((time.perf_counter() - started) * 1000)
+        session.close()
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    # database_setup opens spotify_tokens.db relative to the working directory
+    workdir = tempfile.mkdtemp(prefix='tunein_db_bench_')
+    os.chdir(workdir)
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.orm import sessionmaker
+    from database_setup import Base, Recommendation, set_sqlite_pragmas
+
+    engine = create_engine(f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    event.listen(engine, 'connect', set_sqlite_pragmas)
+    Base.metadata.create_all(engine)
+    session_factory = sessionmaker(bind=engine)
+    table = Recommendation.__table__
+    index = next(index for index in table.indexes if index.name == 'ix_recommendations_user_type')
+
+    print(f"{'rows':>10} {'index':>6} {'p50 ms':>9} {'p95 ms':>9}")
+    rows = 0
+    for size in sorted(args.sizes):
+        index.drop(engine, checkfirst=True)
+        populate(engine, table, rows, size, args.users)
+        rows = size
+        for indexed in (False, True):
+            if indexed:
+                index.create(engine, checkfirst=True)
+            p50, p95 = time_queries(session_factory, Recommendation, args.users, args.queries)
+            print(f"{rows:>10} {'yes' if indexed else 'no':>6} {p50:>9.3f} {p95:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+# Minimal stand-ins for the discord.py objects the bot's handlers touch. They record what
+# the bot sent and when, which is all the benchmarks need.
+import discord
+import itertools
+import time
+
+ids = itertools.count(10 ** 17)
+
+
+def spotify_activity(n):
+    now = int(time.time() * 1000)
+    return discord.Spotify(details=f'Song {n}', state=f'Artist {n % 997}', assets={'large_image': f'spotify:{n}'},
+                           sync_id=f'track{n:05d}', session_id='bench', party={'id': 'spotify:bench'},
+                           timestamps={'start': now, 'end': now + 180000})
+
+
+class FakeMessage:
+    def __init__(self, content=None, author=None, channel=None, guild=None):
+        self.id = next(ids)
+        self.content = content or ''
+        self.author = author
+        self.channel = channel
+        self.guild = guild
+        self.edits = 0
+        self.deleted = False
+
+    async def edit(self, content=None, **kwargs):
+        if content is not None:
+            self.content = content
+        self.edits += 1
+        return self
+
+    async def delete(self):
+        self.deleted = True
+
+    async def add_reaction(self, emoji):
+        pass
+
+    async def pin(self):
+        pass
+
+    async def unpin(self):
+        pass
+
+
+class FakeChannel:
+    def __init__(self, name='general'):
+        self.id = next(ids)
+        self.name = name
+        self.sent = 0
+
+    async def send(self, content=None, **kwargs):
+        self.sent += 1
+        return FakeMessage(content, channel=self)
+
+    async def pins(self):
+        return []
+
+
+class FakeMember:
+    def __init__(self, user_id, activities=()):
+        self.id = user_id
+        self.name = f'member{user_id}'
+        self.display_name = f'Member {user_id}'
+        self.mention = f'<@{user_id}>'
+        self.bot = False
+        self.activities = list(activities)
+        self.dm_channel = None
+        self.dms = 0
+
+    async def send(self, content=None, **kwargs):
+        self.dms += 1
+        return FakeMessage(content, author=self)
+
+    async def create_dm(self):
+        self.dm_channel = FakeChannel(name=f'dm-{self.id}')
+        return self.dm_channel
+
+
+class FakeGuild:
+    def __init__(self, members):
+        self.id = next(ids)
+        self.name = 'Bench Guild'
+        self.members = members
+        self.by_id = {member.id: member for member in members}
+
+    def get_member(self, user_id):
+        return self.by_id.get(user_id)
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self.done = False
+
+    async def send_message(self, content=None, **kwargs):
+        self.done = True
+        self.interaction.responded()
+
+    async def defer(self, **kwargs):
+        self.done = True
+
+    def is_done(self):
+        return self.done
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, wait=False, **kwargs):
+        self.interaction.responded()
+        return FakeMessage(content)
+
+
+class FakeInteraction:
+    def __init__(self, user, guild, command):
+        self.id = next(ids)
+        self.user = user
+        self.guild = guild
+        self.command = command
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.created_at = discord.utils.utcnow()
+        self.started_at = time.perf_counter()
+        self.first_response_at = None
+        self.edits = 0
+
+    def responded(self):
+        # Time until the user first sees something, the latency that matters for slash commands
+        if self.first_response_at is None:
+            self.first_response_at = time.perf_counter()
+
+    async def edit_original_response(self, **kwargs):
+        self.edits += 1
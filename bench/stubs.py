@@ -0,0 +1,177 @@
+# Local stand-ins for the Spotify Web API, flash_server's /refresh_token and the OpenAI
+# API, for running the bot's handlers without credentials. Each stub is a threaded HTTP
+# server on its own port with a fixed latency (plus jitter) per request and an optional
+# share of requests answered with 429 + Retry-After, like the real services under load.
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+
+def make_track(n):
+    return {
+        'id': f'track{n:05d}',
+        'name': f'Song {n}',
+        'artists': [{'id': f'artist{n % 997}', 'name': f'Artist {n % 997}'}],
+        'album': {'id': f'album{n % 499}', 'name': f'Album {n % 499}', 'images': [{'url': f'https://i.scdn.co/image/{n}'}]},
+        'external_urls': {'spotify': f'https://open.spotify.com/track/track{n:05d}'},
+        'uri': f'spotify:track:track{n:05d}',
+    }
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler, latency=0.05, jitter=0.02, rate_limit_ratio=0.0, retry_after=1):
+        super().__init__(('127.0.0.1', 0), handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.requests = {}  # path -> count
+        self.rate_limited = 0
+        self.thread = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def count(self, path):
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def reset_counts(self):
+        with self.lock:
+            self.requests = {}
+            self.rate_limited = 0
+
+    def total_requests(self):
+        with self.lock:
+            return sum(self.requests.values())
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, so connection pooling behaves as in production
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def do_PUT(self):
+        self.handle_request('PUT')
+
+    def handle_request(self, method):
+        server = self.server
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        server.count(url.path)
+        time.sleep(max(0.0, server.latency + random.uniform(-server.jitter, server.jitter)))
+        if server.rate_limit_ratio and random.random() < server.rate_limit_ratio:
+            with server.lock:
+                server.rate_limited += 1
+            self.send_json(429, {'error': {'status': 429, 'message': 'API rate limit exceeded'}},
+                           headers={'Retry-After': str(server.retry_after)})
+            return
+        self.route(method, url.path, parse_qs(url.query), body)
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def route(self, method, path, query, body):
+        self.send_json(404, {'error': 'not found'})
+
+
+class SpotifyHandler(StubHandler):
+    def route(self, method, path, query, body):
+        user = self.headers.get('Authorization', '').rsplit('-', 1)[-1]
+        n = int(user) if user.isdigit() else random.randrange(100000)
+        if path == '/v1/me/player/currently-playing':
+            self.send_json(200, {'is_playing': True, 'item': make_track(n)})
+        elif path == '/v1/me':
+            self.send_json(200, {'id': f'user{n}', 'display_name': f'User {n}', 'images': [], 'followers': {'total': 0},
+                                 'external_urls': {'spotify': f'https://open.spotify.com/user/user{n}'}})
+        elif path == '/v1/me/top/tracks':
+            limit = int(query.get('limit', ['20'])[0])
+            self.send_json(200, {'items': [make_track(n + i) for i in range(limit)]})
+        elif path == '/v1/me/top/artists':
+            limit = int(query.get('limit', ['20'])[0])
+            self.send_json(200, {'items': [{'id': f'artist{n + i}', 'name': f'Artist {n + i}'} for i in range(limit)]})
+        elif path == '/v1/search':
+            limit = int(query.get('limit', ['10'])[0])
+            self.send_json(200, {'tracks': {'items': [make_track(n + i) for i in range(limit)]}})
+        elif path == '/refresh_token':
+            refresh_token = query.get('refresh_token', [''])[0]
+            self.send_json(200, {'access_token': f'fresh-{refresh_token}', 'expires_in': 3600, 'token_type': 'Bearer'})
+        else:
+            self.send_json(404, {'error': {'status': 404, 'message': 'Not found'}})
+
+
+class OpenAIHandler(StubHandler):
+    # chunks and chunk_delay shape streamed replies; they are set on the handler class
+    chunks = 12
+    chunk_delay = 0.02
+
+    def route(self, method, path, query, body):
+        request = json.loads(body or b'{}')
+        if path == '/v1/moderations':
+            inputs = request.get('input', [])
+            inputs = inputs if isinstance(inputs, list) else [inputs]
+            self.send_json(200, {'id': 'modr-bench', 'model': 'text-moderation-latest', 'results': [self.moderation(text) for text in inputs]})
+        elif path == '/v1/chat/completions':
+            reply = f"Song {random.randrange(10 ** 6)} by Artist {random.randrange(997)}\nA bench recommendation with a short explanation."
+            if request.get('stream'):
+                self.stream_reply(request.get('model', 'gpt-4'), reply)
+            else:
+                self.send_json(200, {
+                    'id': 'chatcmpl-bench', 'object': 'chat.completion', 'created': int(time.time()), 'model': request.get('model', 'gpt-4'),
+                    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': reply}, 'finish_reason': 'stop'}],
+                })
+        else:
+            self.send_json(404, {'error': {'message': 'Not found'}})
+
+    def moderation(self, text):
+        flagged = 'flagme' in text
+        categories = {'harassment': flagged, 'hate': False, 'self-harm': False, 'sexual': False, 'violence': False}
+        return {'flagged': flagged, 'categories': categories, 'category_scores': {name: 0.99 if value else 0.01 for name, value in categories.items()}}
+
+    def stream_reply(self, model, reply):
+        # Server-sent events, delimited by closing the connection
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        size = max(1, len(reply) // self.chunks + 1)
+        for start in range(0, len(reply), size):
+            chunk = {'id': 'chatcmpl-bench', 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model,
+                     'choices': [{'index': 0, 'delta': {'content': reply[start:start + size]}, 'finish_reason': None}]}
+            self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode())
+            self.wfile.flush()
+            time.sleep(self.chunk_delay)
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.wfile.flush()
@@ -1,32 +1,45 @@
+from ai_client import AsyncAIClient
 import asyncio
+from async_db import db
+from catalog import SpotifyCatalog, parse_spotify_id, parse_spotify_link
 from enum import Enum, auto
 from config import config
-from datetime import datetime, timedelta
 import discord
 from discord import app_commands
 from discord.ext import commands
-from flash_server import get_token, save_token
+import functools
+from http_pool import http_session
 import json
 import logging
+from log_setup import setup_logging
+from message_pipeline import MessagePipeline
+from metrics import metrics
+from moderation import ModerationBatcher
+from now_playing import NowPlayingIndex
 import openai
+from outbound import outbound
+from profile_cache import ProfileCache
 from openai import OpenAI
 import os
-import pytz
-import requests
+import re
+from recommendation_index import RecommendationIndex, describe
+from scheduler import Scheduler
+from search_cache import SearchCache
+from session_store import SessionStore
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials, SpotifyOAuth
+from single_flight import SingleFlight
+from spotify_client import AsyncSpotifyClient
+from token_refresher import TokenRefresher
+from token_store import TokenStore
+from trivia_pool import TriviaPool, parse_trivia
 import time
 from sqlalchemy import create_engine, Column, String, Integer
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from database_setup import Base, SpotifyToken, add_playlist_to_db, fetch_all_playlists_from_db, save_music_profile, get_music_profile, add_recommendation, get_recommendations, initialize_database
 
-# Set up logging to the console
-logger = logging.getLogger('discord')
-logger.setLevel(logging.DEBUG)
-handler = logging.FileHandler(filename='discord.log', encoding='utf-8', mode='w')
-handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
-logger.addHandler(handler)
+# Set up logging to a rotating file (and the console); writes happen on a background thread
+log_listener, log_handler = setup_logging()
 
 # Retrieve token
 token_path = 'tokens.json'
@@ -67,153 +80,277 @@ class ModBot(commands.Bot):
         intents.members = True
         intents.presences = True
         super().__init__(command_prefix='.', intents=intents)
-        self.openai_client = openai.OpenAI(api_key=openai_api_key)
-        self.user_state = {}  # Store states for bot DM interactions
-        self.user_profiles = {}  # Store music profiles
-        self.spotify_bot = SpotifyBot(spotify_client_id, spotify_client_secret, spotify_redirect_uri, self.tree, discord_guild, self.user_profiles, self.openai_client)
+        self.openai_client = openai.AsyncOpenAI(api_key=openai_api_key, base_url=config.OPENAI_BASE_URL)
+        self.ai_client = AsyncAIClient(self.openai_client)
+        self.moderation = ModerationBatcher(self.openai_client)
+        self.scheduler = Scheduler()
+        self.trivia_bot = None
+        self.daily_tunein_bot = None
+        self.sessions = SessionStore(State)  # DM states and in-progress music profiles
+        self.spotify_bot = SpotifyBot(spotify_client_id, spotify_client_secret, spotify_redirect_uri, self.tree, discord_guild, self.ai_client)
+        self.setup_message_pipeline()
 
     async def setup_hook(self):
+        await db.initialize()
+        self.moderation.start()
+        await self.sessions.load()
+        await self.spotify_bot.token_store.load()
+        await self.spotify_bot.search_cache.load()
+        self.spotify_bot.token_refresher.start()
         await self.spotify_bot.setup_spotify_commands()
         await self.tree.sync(guild=discord.Object(id=discord_guild))
+        self.setup_metrics()
+        try:
+            await metrics.serve()
+        except OSError as e:
+            print(f"Could not start metrics endpoint: {e}")
+
+    def setup_metrics(self):
+        metrics.add_collector('moderation', self.moderation.stats)
+        metrics.add_collector('sessions', self.sessions.stats)
+        metrics.add_collector('message_pipeline', self.message_pipeline.stats)
+        metrics.add_collector('scheduler', self.scheduler.stats)
+        metrics.add_collector('outbound', outbound.stats)
+        metrics.add_collector('http', http_session.stats)
+        metrics.add_collector('logging', log_handler.stats)
+        metrics.add_collector('token_refresher', self.spotify_bot.token_refresher.stats)
+        metrics.add_collector('refresh_flight', self.spotify_bot.refresh_flight.stats)
+        metrics.add_collector('now_playing', self.spotify_bot.now_playing.stats)
+        metrics.add_collector('search_cache', self.spotify_bot.search_cache.stats)
+        metrics.add_collector('catalog', self.spotify_bot.catalog.stats)
+        metrics.add_collector('profile_cache', self.spotify_bot.profile_cache.stats)
+        metrics.add_collector('recommendation_index', self.spotify_bot.recommendation_index.stats)
+
+    async def close(self):
+        self.moderation.stop()
+        self.scheduler.stop()
+        metrics.close()
+        self.spotify_bot.token_refresher.stop()
+        self.spotify_bot.spotify_client.close()
+        db.close()
+        await super().close()
 
     async def on_ready(self):
         print(f'{self.user.name} has connected to Discord! It is these guilds:')
         for guild in self.guilds:
             print(f' - {guild.name}')
+            for member in guild.members:
+                self.spotify_bot.now_playing.update_from_member(member)
         print('Press Ctrl-C to quit.')
 
         trivia_channel = discord.utils.get(self.get_all_channels(), name='trivia')
         if trivia_channel:
             print(f"Found trivia channel: {trivia_channel.id}")
-            self.scheduler = TriviaBot(trivia_channel, self.openai_client)
-            asyncio.create_task(self.scheduler.start())
+            # on_ready fires again after reconnects; keep the same bot and pool, just refresh the channel
+            if self.trivia_bot:
+                self.trivia_bot.channel = trivia_channel
+            else:
+                self.trivia_bot = TriviaBot(trivia_channel, self.ai_client)
+            await self.scheduler.register('trivia', self.trivia_bot.post_trivia, hour=12, timezone=self.trivia_bot.timezone)
+            await self.scheduler.register('trivia_pool_refill', self.trivia_bot.refill_pool, interval=3600)
+            self.trivia_bot.pool.refill_in_background()
+            metrics.add_collector('trivia_pool', self.trivia_bot.pool.stats)
         else:
             print("Trivia channel not found. Make sure the bot is in the correct server and the channel exists.")
 
         daily_tunein_channel = discord.utils.get(self.get_all_channels(), name='daily-tunein')
         if daily_tunein_channel:
             print(f"Found daily tune-in channel: {daily_tunein_channel.id}")
-            self.daily_tunein_scheduler = DailyTuneInBot(daily_tunein_channel)
-            asyncio.create_task(self.daily_tunein_scheduler.start())
+            if self.daily_tunein_bot:
+                self.daily_tunein_bot.channel = daily_tunein_channel
+            else:
+                self.daily_tunein_bot = DailyTuneInBot(daily_tunein_channel)
+            await self.scheduler.register('daily_tunein', self.daily_tunein_bot.post_tunein, hour=17, timezone=self.daily_tunein_bot.timezone)
         else:
             print("Daily tune-in channel not found. Make sure the bot is in the correct server and the channel exists.")
 
+        await self.scheduler.register('metrics_summary', metrics.log_summary, interval=config.METRICS_LOG_INTERVAL)
+        self.scheduler.start()
+
+    async def on_presence_update(self, before, after):
+        self.spotify_bot.now_playing.update_from_member(after)
+
+    def setup_message_pipeline(self):
+        # DM keywords are matched against the whole lowercased message
+        self.keyword_handlers = {
+            self.HELP_KEYWORD: self.send_help,
+            self.CANCEL_KEYWORD: self.cancel_action,
+            self.START_REPORT_KEYWORD: self.start_report,
+            self.LEARN_MORE_KEYWORD: self.explain_flag,
+            self.MUSIC_PROFILE_KEYWORD: self.start_music_profile,
+        }
+        # Report steps finish the message; profile answers still go on to moderation
+        self.state_handlers = {
+            State.REPORT_START: self.handle_report_start,
+            State.ADDING_DETAILS: self.handle_report_details,
+            State.AWAITING_NAME: functools.partial(self.handle_profile_answer, 'name', "What are your favorite genres?", State.AWAITING_GENRES),
+            State.AWAITING_GENRES: functools.partial(self.handle_profile_answer, 'genres', "Who are your favorite artists right now?", State.AWAITING_ARTISTS),
+            State.AWAITING_ARTISTS: functools.partial(self.handle_profile_answer, 'artists', "What is your most played song right now?", State.AWAITING_SONG),
+            State.AWAITING_SONG: functools.partial(self.handle_profile_answer, 'song', "What upcoming music events are you attending?", State.AWAITING_EVENTS),
+            State.AWAITING_EVENTS: self.finish_music_profile,
+        }
+        self.message_pipeline = MessagePipeline()
+        self.message_pipeline.add_stage('self_filter', self.skip_own_message)
+        self.message_pipeline.add_stage('dm_keywords', self.route_dm_keyword)
+        self.message_pipeline.add_stage('dm_state', self.route_dm_state)
+        self.message_pipeline.add_stage('prefilter', self.skip_unmoderated)
+        self.message_pipeline.add_stage('moderation', self.moderate_message)
+
     async def on_message(self, message):
-        if message.author == self.user:
+        await self.message_pipeline.process(message)
+
+    async def skip_own_message(self, context):
+        return context.message.author == self.user
+
+    async def route_dm_keyword(self, context):
+        if not context.is_dm:
+            return False
+        print('message sent to bot:', context.message.content)
+        handler = self.keyword_handlers.get(context.content)
+        if handler is None:
+            return False
+        await handler(context.message)
+        return True
+
+    async def route_dm_state(self, context):
+        if not context.is_dm:
+            return False
+        session = await self.sessions.get(context.message.author.id)
+        handler = self.state_handlers.get(session.state) if session else None
+        if handler is None:
+            return False
+        return await handler(context, session)
+
+    async def skip_unmoderated(self, context):
+        # Attachment- or embed-only messages have no text to moderate
+        return not context.content.strip()
+
+    async def send_help(self, message):
+        reply = "If your message was flagged as potentially harmful and was deleted, use the options below.\n"
+        reply += "Type `learn more` to learn why your message was deleted.\n"
+        reply += "Type `report` to dispute if you believe your message was wrongfully deleted.\n\n"
+        reply += "If you would like to create or edit your music profile, use the option below.\n"
+        reply += "Type `music` to create or edit your music profile.\n"
+        await message.author.send(reply)
+
+    async def cancel_action(self, message):
+        session = await self.sessions.session(message.author.id)
+        session.reset()
+        await self.sessions.save(message.author.id, session)
+        await message.author.send("Action cancelled.")
+
+    async def start_report(self, message):
+        reply = "Thank you for starting the reporting process.\n"
+        reply += "Your message will be reviewed by our content moderation team.\n"
+        reply += "Would you like to add additional details to include in the report?\n"
+        reply += "Please respond with `yes` or `no`.\n"
+        session = await self.sessions.session(message.author.id)
+        session.reset(State.REPORT_START)
+        await self.sessions.save(message.author.id, session)
+        await message.author.send(reply)
+
+    async def explain_flag(self, message):
+        session = await self.sessions.get(message.author.id)
+        if not session or not session.data:
+            await message.author.send("There's no flagged message on record for you.")
             return
-
-        if message.guild is None:
-            print('message sent to bot:', message.content)
-            if message.content.lower() == self.HELP_KEYWORD:
-                reply = "If your message was flagged as potentially harmful and was deleted, use the options below.\n"
-                reply += "Type `learn more` to learn why your message was deleted.\n"
-                reply += "Type `report` to dispute if you believe your message was wrongfully deleted.\n\n"
-                reply += "If you would like to create or edit your music profile, use the option below.\n"
-                reply += "Type `music` to create or edit your music profile.\n"
-                await message.author.send(reply)
-                return
-            if message.content.lower() == self.CANCEL_KEYWORD:
-                self.user_state[message.author.id] = {'state': None}
-                await message.author.send("Action cancelled.")
-                return
-            if message.content.lower() == self.START_REPORT_KEYWORD:
-                reply = "Thank you for starting the reporting process.\n"
-                reply += "Your message will be reviewed by our content moderation team.\n"
-                reply += "Would you like to add additional details to include in the report?\n"
-                reply += "Please respond with `yes` or `no`.\n"
-                self.user_state[message.author.id] = {'state': State.REPORT_START}
-                await message.author.send(reply)
-                return
-            if message.content.lower() == self.LEARN_MORE_KEYWORD:
-                content, categories = self.user_state[message.author.id]['data']
-                categories = [category.replace('_', ' ').replace('/', ' ') for category in categories]
-                reply = f"Your message\n`{content}`\nwas flagged due to: " + ', '.join(categories) + ".\n"
-                self.user_state[message.author.id]['state'] = State.MESSAGE_DETAILS
-                await message.author.send(reply)
-                return
-            if message.content.lower() == self.MUSIC_PROFILE_KEYWORD:
-                self.user_state[message.author.id] = {'state': State.CREATE_EDIT_PROFILE}
-                if message.author.id in self.user_profiles:
-                    profile = self.user_profiles[message.author.id]
-                    reply = "Your current profile:\n"
-                    reply += f"Name: {profile['name']}\nFavorite Genres: {profile['genres']}\nFavorite Artists: {profile['artists']}\nMost played song right now: {profile['song']}\nUpcoming music events you're attending: {profile['events']}\n\n"
-                    reply += "Let's update your music profile.\n"
-                    reply += "What is your preferred name?\n"
-                else:
-                    reply = "Let's create your music profile.\n"
-                    reply += "What is your preferred name?\n"
-                await message.author.send(reply)
-                self.user_state[message.author.id]['state'] = State.AWAITING_NAME
-                return
-            
-            user_state = self.user_state.get(message.author.id)
-            if user_state:
-                state = user_state['state']
-
-                if state == State.REPORT_START:
-                    if message.content.lower() == 'yes':
-                        await message.author.send("Please provide the additional details for your report.")
-                        self.user_state[message.author.id]['state'] = State.ADDING_DETAILS
-                    elif message.content.lower() == 'no':
-                        await message.author.send("Thank you for submitting a report. You will be notified if your message is restored.\n")
-                        self.user_state[message.author.id] = {'state': None}
-                    return
-                if state == State.ADDING_DETAILS:
-                    await message.author.send("Thank you for the additional details. Your report has been updated and submitted. You will be notified if your message is restored.\n")
-                    self.user_state[message.author.id] = {'state': None}
-                    return
-
-                if state == State.AWAITING_NAME:
-                    if message.author.id not in self.user_profiles:
-                        self.user_profiles[message.author.id] = {}
-                    self.user_profiles[message.author.id]['name'] = message.content
-                    await message.author.send("What are your favorite genres?")
-                    self.user_state[message.author.id]['state'] = State.AWAITING_GENRES
-                elif state == State.AWAITING_GENRES:
-                    self.user_profiles[message.author.id]['genres'] = message.content
-                    await message.author.send("Who are your favorite artists right now?")
-                    self.user_state[message.author.id]['state'] = State.AWAITING_ARTISTS
-                elif state == State.AWAITING_ARTISTS:
-                    self.user_profiles[message.author.id]['artists'] = message.content
-                    await message.author.send("What is your most played song right now?")
-                    self.user_state[message.author.id]['state'] = State.AWAITING_SONG
-                elif state == State.AWAITING_SONG:
-                    self.user_profiles[message.author.id]['song'] = message.content
-                    await message.author.send("What upcoming music events are you attending?")
-                    self.user_state[message.author.id]['state'] = State.AWAITING_EVENTS
-                elif state == State.AWAITING_EVENTS:
-                    self.user_profiles[message.author.id]['events'] = message.content
-
-                    profile = self.user_profiles[message.author.id]
-                    profile.setdefault('top_songs', [])
-                    profile.setdefault('top_artists', [])
-                    # Fetch top songs and artists
-                    token_info = get_token(message.author.id)
-                    if token_info:
-                        access_token = await self.spotify_bot.get_fresh_token(token_info, message.author.id)
-                        if access_token:
-                            top_songs = await self.spotify_bot.get_top_songs(access_token)
-                            top_artists = await self.spotify_bot.get_top_artists(access_token)
-                            self.user_profiles[message.author.id]['top_songs'] = top_songs  # Store as list
-                            self.user_profiles[message.author.id]['top_artists'] = top_artists  # Store as list
-                    save_music_profile(message.author.id, profile)
-                    
-                    profile = self.user_profiles[message.author.id]
-                    reply = "Your music profile has been updated.\n"
-                    reply += f"**Name:** {profile['name']}\n**Favorite genres:** {profile['genres']}\n**Favorite artists right now:** {profile['artists']}\n**Most played song right now:** {profile['song']}\n**Upcoming music events you're attending:** {profile['events']}\n\n"
-                    reply += f"**Top 5 Songs:**\n{'\n'.join(profile['top_songs'])}\n\n"
-                    reply += f"**Top 5 Artists:**\n{'\n'.join(profile['top_artists'])}\n"
-
-                    await message.author.send(reply)
-                    self.user_state[message.author.id] = {'state': None}
-
-        response = self.openai_client.moderations.create(input=message.content)
-        output = response.results[0]
+        content, categories = session.data
+        categories = [category.replace('_', ' ').replace('/', ' ') for category in categories]
+        reply = f"Your message\n`{content}`\nwas flagged due to: " + ', '.join(categories) + ".\n"
+        session.state = State.MESSAGE_DETAILS
+        await self.sessions.save(message.author.id, session)
+        await message.author.send(reply)
+
+    async def start_music_profile(self, message):
+        session = await self.sessions.session(message.author.id)
+        session.reset(State.CREATE_EDIT_PROFILE)
+        if not session.profile or 'events' not in session.profile:
+            # Sessions are evicted when idle, so fall back to the saved profile
+            saved = await self.spotify_bot.profile_cache.get(message.author.id)
+            if saved:
+                session.profile = dict(saved.fields)
+        if session.profile and 'events' in session.profile:
+            profile = session.profile
+            reply = "Your current profile:\n"
+            reply += f"Name: {profile['name']}\nFavorite Genres: {profile['genres']}\nFavorite Artists: {profile['artists']}\nMost played song right now: {profile['song']}\nUpcoming music events you're attending: {profile['events']}\n\n"
+            reply += "Let's update your music profile.\n"
+            reply += "What is your preferred name?\n"
+        else:
+            reply = "Let's create your music profile.\n"
+            reply += "What is your preferred name?\n"
+        await message.author.send(reply)
+        session.state = State.AWAITING_NAME
+        await self.sessions.save(message.author.id, session)
+
+    async def handle_report_start(self, context, session):
+        message = context.message
+        if context.content == 'yes':
+            await message.author.send("Please provide the additional details for your report.")
+            session.state = State.ADDING_DETAILS
+            await self.sessions.save(message.author.id, session)
+        elif context.content == 'no':
+            await message.author.send("Thank you for submitting a report. You will be notified if your message is restored.\n")
+            session.reset()
+            await self.sessions.save(message.author.id, session)
+        return True
+
+    async def handle_report_details(self, context, session):
+        message = context.message
+        await message.author.send("Thank you for the additional details. Your report has been updated and submitted. You will be notified if your message is restored.\n")
+        session.reset()
+        await self.sessions.save(message.author.id, session)
+        return True
+
+    async def handle_profile_answer(self, field, next_question, next_state, context, session):
+        message = context.message
+        if session.profile is None:
+            session.profile = {}
+        session.profile[field] = message.content
+        await message.author.send(next_question)
+        session.state = next_state
+        await self.sessions.save(message.author.id, session)
+        return False
+
+    async def finish_music_profile(self, context, session):
+        message = context.message
+        profile = session.profile
+        profile['events'] = message.content
+        profile.setdefault('top_songs', [])
+        profile.setdefault('top_artists', [])
+        # Fetch top songs and artists
+        token_info = await self.spotify_bot.token_store.get(message.author.id)
+        if token_info:
+            access_token = await self.spotify_bot.get_fresh_token(token_info, message.author.id)
+            if access_token:
+                top_songs = await self.spotify_bot.get_top_songs(access_token)
+                top_artists = await self.spotify_bot.get_top_artists(access_token)
+                profile['top_songs'] = top_songs  # Store as list
+                profile['top_artists'] = top_artists  # Store as list
+        await self.spotify_bot.profile_cache.save(message.author.id, profile)
+
+        reply = "Your music profile has been updated.\n"
+        reply += f"**Name:** {profile['name']}\n**Favorite genres:** {profile['genres']}\n**Favorite artists right now:** {profile['artists']}\n**Most played song right now:** {profile['song']}\n**Upcoming music events you're attending:** {profile['events']}\n\n"
+        reply += f"**Top 5 Songs:**\n{'\n'.join(profile['top_songs'])}\n\n"
+        reply += f"**Top 5 Artists:**\n{'\n'.join(profile['top_artists'])}\n"
+
+        await message.author.send(reply)
+        session.reset()
+        await self.sessions.save(message.author.id, session)
+        return False
+
+    async def moderate_message(self, context):
+        message = context.message
+        try:
+            output = await self.moderation.check(message.content)
+        except Exception as e:
+            print(f"Failed to moderate message: {e}")
+            return True
 
         if output.flagged:
             await message.delete()
             flagged_categories = [category for category, flagged in output.categories.dict().items() if flagged]
-            self.user_state[message.author.id] = {'state': State.MESSAGE_DETAILS, 'data': (message.content, flagged_categories)}
+            session = await self.sessions.session(message.author.id)
+            session.reset(State.MESSAGE_DETAILS, (message.content, flagged_categories))
 
             warning_message = f"Your message \n`{message.content}`\nwas flagged as potentially harmful and has been deleted.\n\n"
             warning_message += "Please remember to adhere to the community guidelines.\n\n\n"
@@ -223,38 +360,34 @@ class ModBot(commands.Bot):
             if message.author.dm_channel is None:
                 await message.author.create_dm()
             await message.author.dm_channel.send(warning_message)
-            self.user_state[message.author.id]['state'] = State.MESSAGE_DETAILS
+            await self.sessions.save(message.author.id, session)
 
-        return None
+        return True
 
 
 
 class TriviaBot:
-    def __init__(self, channel, openai_client, timezone='US/Pacific'):
+    def __init__(self, channel, ai_client, timezone='US/Pacific'):
         self.channel = channel
         self.timezone = timezone
-        self.openai_client = openai_client
+        self.ai_client = ai_client
+        self.pool = TriviaPool(self.generate_trivia_prompt)
 
     async def generate_trivia_prompt(self):
         try:
-            response = self.openai_client.chat.completions.create(
+            response = await self.ai_client.complete(
                 model="gpt-3.5-turbo",
                 messages=[
-                    {"role": "system", "content": "You are a music trivia bot, skilled in generating interesting musical trivia questions with diverse musical interests. Format the trivia question followed by four possible answers and indicate the correct answer at the end as 'Correct: A'."},
+                    {"role": "system", "content": "You are a music trivia bot, skilled in generating interesting musical trivia questions with diverse musical interests. Format the trivia question followed by four possible answers on their own lines as 'A) ...' through 'D) ...' and indicate the correct answer at the end as 'Correct: A'."},
                     {"role": "user", "content": "Generate a trivia question with four possible answers, indicating which one is correct."}
                 ])
             if response.choices and response.choices[0].message:
                 trivia_data = response.choices[0].message.content.strip()
-                if 'Correct:' not in trivia_data:
+                trivia = parse_trivia(trivia_data)
+                if not trivia:
                     print("Unexpected format received:", trivia_data)
                     return None, None, None
-
-                question_part, answer_part = trivia_data.split('Correct:')
-                question = question_part.strip()
-                correct_answer = answer_part.strip()
-                options = question.split('\n')[-4:]
-                correct_answer_letter = correct_answer[0]
-                return question, options, correct_answer_letter
+                return trivia
             else:
                 raise ValueError("No valid response received from OpenAI.")
         except Exception as e:
@@ -262,14 +395,15 @@ class TriviaBot:
             return None, None, None
 
     async def unpin_messages(self):
-        pins = await self.channel.pins()
-        if pins:
-            for pin in pins:
-                await pin.unpin()
+        if await outbound.unpin_all(self.channel):
             print("All previous pins unpinned.")
         else:
             return None
 
+    async def open_discussion(self, sent_message):
+        thread = await outbound.run(('thread', self.channel.id), sent_message.create_thread, name="Trivia Question Discussion")
+        await outbound.send(thread, "Discuss today's trivia question here!")
+
     # async def start(self):
     #     while True:
     #         now = datetime.now(pytz.timezone(self.timezone))
@@ -305,49 +439,39 @@ class TriviaBot:
     #             print("Could not generate trivia question.\n.")
     #         else:
     #             print("Other error in start().\n")
-    async def start(self):
-        while True:
-            now = datetime.now(pytz.timezone(self.timezone))
-            print(now)
-            next_run = now.replace(hour=12, minute=0, second=0, microsecond=0)
-            print(next_run)
-            
-            if now >= next_run:
-                next_run += timedelta(days=1)
-                print("new next run", next_run)
-            
-            wait_seconds = (next_run - now).total_seconds()
-            print(f"Waiting {wait_seconds} seconds until the next message at 12:00 PM {self.timezone}.")
-            await asyncio.sleep(wait_seconds)
-            
-            # Recalculate `now` and `next_run` after waking up to ensure exact timing
-            now = datetime.now(pytz.timezone(self.timezone))
-            next_run = now.replace(hour=12, minute=0, second=0, microsecond=0)
-        
-            if now >= next_run:
-                # Proceed with sending the message only if it's exactly 12:00 PM
-                question, options, correct_answer_letter = await self.generate_trivia_prompt()
-                if question and options and correct_answer_letter and self.channel:
-                    await self.unpin_messages()
-
-                    message = f"@everyone It's trivia time! 🎉\n`{question}`\n"
-                    message += "\nReact with 🎹 for A\nReact with 🎧 for B\nReact with 🎸 for C\nReact with 🎵 for D."
-                    sent_message = await self.channel.send(message)
-                    emojis = {'A': '🎹', 'B': '🎧', 'C': '🎸', 'D': '🎵'}
-                    for option in options:
-                        emoji = emojis[option.strip()[0]]
-                        await sent_message.add_reaction(emoji)
-
-                    await sent_message.pin()
-                    thread = await sent_message.create_thread(name="Trivia Question Discussion")
-                    await thread.send("Discuss today's trivia question here!")
-
-                elif question and options and correct_answer_letter and not self.channel:
-                    print("Channel not found or missing. Check the configuration.\n")
-                elif self.channel and not question and not options and not correct_answer_letter:
-                    print("Could not generate trivia question.\n.")
-                else:
-                    print("Other error in start().\n")
+    async def next_question(self):
+        # The pool is normally stocked; generating live is only a fallback
+        trivia = await self.pool.take()
+        if trivia:
+            return trivia
+        return await self.generate_trivia_prompt()
+
+    async def refill_pool(self):
+        # Shares the task with any refill already running
+        self.pool.refill_in_background()
+        await self.pool.refill_task
+
+    # Run by the scheduler every day at 12:00 PM
+    async def post_trivia(self):
+        question, options, correct_answer_letter = await self.next_question()
+        if question and options and correct_answer_letter and self.channel:
+            message = f"@everyone It's trivia time! 🎉\n`{question}`\n"
+            message += "\nReact with 🎹 for A\nReact with 🎧 for B\nReact with 🎸 for C\nReact with 🎵 for D."
+            # The new message isn't pinned yet, so clearing old pins can overlap with sending it
+            _, sent_message = await asyncio.gather(self.unpin_messages(), outbound.send(self.channel, message))
+            emojis = {'A': '🎹', 'B': '🎧', 'C': '🎸', 'D': '🎵'}
+            await asyncio.gather(
+                outbound.add_reactions(sent_message, [emojis[option.strip()[0]] for option in options]),
+                outbound.run(('pin', self.channel.id), sent_message.pin),
+                self.open_discussion(sent_message),
+            )
+
+        elif question and options and correct_answer_letter and not self.channel:
+            print("Channel not found or missing. Check the configuration.\n")
+        elif self.channel and not question and not options and not correct_answer_letter:
+            print("Could not generate trivia question.\n.")
+        else:
+            print("Other error in post_trivia().\n")
 
 
 
@@ -377,53 +501,53 @@ class DailyTuneInBot:
         self.channel = channel
         self.timezone = timezone
 
-    async def start(self):
-        while True:
-            now = datetime.now(pytz.timezone(self.timezone))
-            next_run = now.replace(hour=17, minute=0, second=0, microsecond=0)
-            if now >= next_run:
-                next_run += timedelta(days=1)
-            wait_seconds = (next_run - now).total_seconds()
-            print(f"Waiting {wait_seconds} seconds until the next message at 5:00 PM {self.timezone}.")
-            await asyncio.sleep(wait_seconds)
-
-            # Recalculate `now` and `next_run` after waking up to ensure exact timing
-            now = datetime.now(pytz.timezone(self.timezone))
-            next_run = now.replace(hour=17, minute=0, second=0, microsecond=0)
-
-            if now >= next_run:
-                # Proceed with sending the message only if it's exactly 5:00 PM
-                if self.channel:
-                    await self.channel.send("@everyone It's daily tune-in time! 🎶\n")
-                    await self.channel.send("Use `/authenticate` to re-authenticate with Spotify.")
-                    await self.channel.send("Then use `/currently_playing` to share your currently playing song!")
-                else:
-                    print("Daily tune-in channel not found. Check the configuration.\n")
+    # Run by the scheduler every day at 5:00 PM
+    async def post_tunein(self):
+        if self.channel:
+            # Sent together so the pipeline posts them as one message
+            await asyncio.gather(
+                outbound.send(self.channel, "@everyone It's daily tune-in time! 🎶\n"),
+                outbound.send(self.channel, "Use `/authenticate` to re-authenticate with Spotify."),
+                outbound.send(self.channel, "Then use `/currently_playing` to share your currently playing song!"),
+            )
+        else:
+            print("Daily tune-in channel not found. Check the configuration.\n")
 
 
 
 class SpotifyBot:
-    def __init__(self, client_id, client_secret, redirect_uri, tree, guild_id, user_profiles, openai_client):
+    def __init__(self, client_id, client_secret, redirect_uri, tree, guild_id, ai_client):
         self.sp_oauth = SpotifyOAuth(client_id=client_id, client_secret=client_secret, redirect_uri=redirect_uri, 
                                      scope="user-read-private user-read-email user-read-playback-state user-top-read playlist-read-private playlist-read-collaborative playlist-modify-public playlist-modify-private")
         self.tree = tree
         self.guild = discord.Object(id=guild_id)
-        self.user_profiles = user_profiles
-        self.openai_client = openai_client
+        self.ai_client = ai_client
+        self.spotify_client = AsyncSpotifyClient()
+        self.token_store = TokenStore()
+        self.now_playing = NowPlayingIndex()
+        self.search_cache = SearchCache()
+        self.catalog = SpotifyCatalog()
+        self.recommendation_index = RecommendationIndex()
+        self.profile_cache = ProfileCache()
+        self.refresh_flight = SingleFlight()  # Concurrent refreshes for one user share a single request
+        self.token_refresher = TokenRefresher(self.token_store, self.refresh_access_token)
 
     
     async def setup_spotify_commands(self):
         @self.tree.command(name='authenticate', description='Authenticate with Spotify', guild=self.guild)
+        @metrics.instrument_command
         async def authenticate_spotify(interaction: discord.Interaction):
             user_id = str(interaction.user.id)
+            self.token_store.expect_reauthentication(user_id)
             # auth_url = f"http://localhost:8888/login?user_id={user_id}"
-            auth_url = f"https://5c04-128-12-123-206.ngrok-free.app/login?user_id={user_id}"
+            auth_url = f"{config.AUTH_SERVER_URL}/login?user_id={user_id}"
             await interaction.response.send_message(f"Please authenticate using this URL: {auth_url}", ephemeral=True)
 
         @self.tree.command(name='spotify_profile', description='Share your Spotify profile', guild=self.guild)
+        @metrics.instrument_command
         async def spotify_profile(interaction: discord.Interaction):
             user_id = str(interaction.user.id)
-            token_info = get_token(user_id)  # Retrieve the token from the database
+            token_info = await self.token_store.get(user_id)
             access_token = await self.get_fresh_token(token_info, user_id)
             if not access_token:
                 await interaction.response.send_message("Please authenticate with Spotify first using /authenticate_spotify.", ephemeral=True)
@@ -432,7 +556,7 @@ class SpotifyBot:
             headers = {
                 'Authorization': f'Bearer {access_token}'
             }
-            response = requests.get('https://api.spotify.com/v1/me', headers=headers)
+            response = await self.spotify_client.get(f"{config.SPOTIFY_API_URL}me", headers=headers)
             if response.status_code == 200:
                 profile_data = response.json()
                 display_name = profile_data.get('display_name', 'N/A')
@@ -453,23 +577,17 @@ class SpotifyBot:
                 await interaction.response.send_message('Failed to retrieve Spotify profile.')
 
         @self.tree.command(name='music_profile', description='Share your music profile with others', guild=self.guild)
+        @metrics.instrument_command
         async def music_profile(interaction: discord.Interaction):
             user_id = interaction.user.id
-            profile = get_music_profile(user_id)
+            profile = await self.profile_cache.get(user_id)
             if profile:
-                reply = f"**Music Profile for {interaction.user.display_name}:**\n"
-                reply += f"**Preferred Name:** {profile.name}\n"
-                reply += f"**Favorite Genres:** {profile.genres}\n"
-                reply += f"**Favorite Artists:** {profile.artists}\n"
-                reply += f"**Most played song right now:** {profile.song}\n"
-                reply += f"**Upcoming music events they're attending:** {profile.events}\n"
-                reply += "**Top 5 Songs:**\n" + "\n".join(profile.top_songs) + "\n"
-                reply += "**Top 5 Artists:**\n" + "\n".join(profile.top_artists)
-                await interaction.response.send_message(reply)
+                await interaction.response.send_message(profile.render(interaction.user.display_name))
             else:
                 await interaction.response.send_message('You do not have a music profile yet. Create one by DM\'ing the bot `music`.', ephemeral=True)
 
         @self.tree.command(name='currently_playing', description='Share your currently playing song on Spotify', guild=self.guild)
+        @metrics.instrument_command
         async def playing(interaction: discord.Interaction):
             user_id = str(interaction.user.id)
             track_info = await self.fetch_currently_playing(user_id)
@@ -488,48 +606,90 @@ class SpotifyBot:
                 await interaction.response.send_message('No track currently playing.')
 
         @self.tree.command(name='listening', description="Find who's listening to what on the server", guild=self.guild)
+        @metrics.instrument_command
         async def listening(interaction: discord.Interaction):
-            members = interaction.guild.members
             listening_info = []
-            for member in members:
-                user_id = str(member.id)
-                track_info = await self.fetch_currently_playing(user_id)
+
+            def add_listener(member, track_info):
+                listening_info.append({
+                    "member_name": member.display_name,
+                    "track_name": track_info['track_name'],
+                    "artist_name": track_info['artist_name'],
+                    "album_cover_url": track_info['album_cover_url'],
+                    "track_url": track_info['track_url']
+                })
+
+            # Members whose Discord presence shows Spotify are answered from the index
+            answered = set()
+            for user_id, track_info in self.now_playing.playing():
+                member = interaction.guild.get_member(int(user_id))
+                if member:
+                    add_listener(member, track_info)
+                    answered.add(user_id)
+
+            # Everyone else can only be found through the API, and only if they have
+            # authenticated, so start from the token store instead of every guild member.
+            authenticated_ids = self.token_store.user_ids()
+            members = [interaction.guild.get_member(int(user_id)) for user_id in authenticated_ids if user_id.isdigit() and user_id not in answered]
+            members = [member for member in members if member]
+            if not members and not listening_info:
+                await interaction.response.send_message("No one is currently listening to anything on Spotify or they haven't authenticated.", ephemeral=True)
+                return
+
+            semaphore = asyncio.Semaphore(config.LISTENING_CONCURRENCY)
+
+            async def poll(member):
+                async with semaphore:
+                    try:
+                        track_info = await self.fetch_currently_playing(str(member.id))
+                    except Exception as e:
+                        logging.error(f"Failed to fetch currently playing for user {member.id}: {e}")
+                        return
                 if track_info:
-                    listening_info.append({
-                        "member_name": member.display_name,
-                        "track_name": track_info['track_name'],
-                        "artist_name": track_info['artist_name'],
-                        "album_cover_url": track_info['album_cover_url'],
-                        "track_url": track_info['track_url']
-                    })
-
-            if listening_info:
-                embed = discord.Embed(title="Currently Listening To", color=discord.Color.blue())
-                for info in listening_info:
-                    embed.add_field(
-                        name=f"{info['member_name']} is listening to:",
-                        value=f"[{info['track_name']} by {info['artist_name']}]({info['track_url']})",
-                        inline=False
-                    )
-                    if info['album_cover_url']:
-                        embed.set_thumbnail(url=info['album_cover_url'])
+                    add_listener(member, track_info)
 
-                await interaction.response.send_message(embed=embed)
-            else:
+            tasks = [asyncio.create_task(poll(member)) for member in members]
+            pending = set()
+            if tasks:
+                # Discord's 3 s limit runs from when the interaction was created, not from here
+                elapsed = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+                deadline = min(config.LISTENING_DEADLINE, max(0, config.LISTENING_DEADLINE - elapsed))
+                _, pending = await asyncio.wait(tasks, timeout=deadline)
+
+            if not listening_info and not pending:
                 await interaction.response.send_message("No one is currently listening to anything on Spotify or they haven't authenticated.", ephemeral=True)
+                return
+
+            # Answer with whatever arrived by the deadline, then keep editing as stragglers finish
+            await interaction.response.send_message(embed=self.build_listening_embed(listening_info, len(pending)))
+            rendered = len(listening_info)
+            give_up_at = time.monotonic() + config.LISTENING_MAX_WAIT
+            while pending:
+                remaining = give_up_at - time.monotonic()
+                if remaining <= 0:
+                    for task in pending:
+                        task.cancel()
+                    pending = set()
+                else:
+                    _, pending = await asyncio.wait(pending, timeout=min(config.LISTENING_EDIT_INTERVAL, remaining))
+                if len(listening_info) != rendered or not pending:
+                    rendered = len(listening_info)
+                    await interaction.edit_original_response(embed=self.build_listening_embed(listening_info, len(pending)))
 
         @self.tree.command(name='recommend', description='Recommend a song, album, or artist to the channel', guild=self.guild)
         @app_commands.describe(search_type="Type of search: song, album, artist", query="Title of song, album, or artist name")
+        @metrics.instrument_command
         async def search(interaction: discord.Interaction, query: str, search_type: str):
             user_id = str(interaction.user.id)
-            token_info = get_token(user_id)  # Retrieve the token from the database
+            token_info = await self.token_store.get(user_id)
             access_token = await self.get_fresh_token(token_info, user_id)
             if not access_token:
                 await interaction.response.send_message("Please authenticate with Spotify first using /authenticate_spotify.", ephemeral=True)
                 return
             
-            sp = spotipy.Spotify(auth=access_token)
-            results = sp.search(q=query, type=search_type, limit=1)
+            results = await self.search_cache.search(self.spotify_client, access_token, query, search_type)
+            if results:
+                self.catalog.add_search_results(results)
             embed = discord.Embed(title=f"Search results for '{query}'", color=discord.Color.blue())
             
             if results:
@@ -658,9 +818,10 @@ class SpotifyBot:
 
         @self.tree.command(name='discover', description='Discover new music with AI recommendations', guild=self.guild)
         @app_commands.describe(search_type="Type of search: Song, Album, Artist, Random")
+        @metrics.instrument_command
         async def discover_music(interaction: discord.Interaction, search_type: str):
             user_id = str(interaction.user.id)
-            profile_info = get_music_profile(user_id)
+            profile_info = await self.profile_cache.get(user_id)
             
             if not profile_info:
                 await interaction.response.send_message("You do not have a music profile yet. Create one by DM'ing the bot `music`.", ephemeral=True)
@@ -669,69 +830,65 @@ class SpotifyBot:
             # Defer the interaction response to get more time
             await interaction.response.defer()
 
-            previous_recommendations = get_recommendations(user_id, search_type.lower())
-            print('previous recommendations:', previous_recommendations)
-            recommendation_info = profile_info.top_songs if search_type.lower() == "song" else profile_info.top_artists
-
-            if search_type.lower() == "random":
-                try:
-                    response = self.openai_client.chat.completions.create(
-                        model="gpt-4",
-                        messages=[
-                            {"role": "system", "content": "You are a music recommendation algorithm. Your task is to recommend a random song from any genre. Do not limit your recommendation to a single genre."},
-                            {"role": "user", "content": "Recommend a song from any genre, culture, country, decade, time period, etc. Do not limit yourself to a single genre of songs. Please include musical diversity, but do not repeat recommended songs."},
-                            {"role": "user", "content": f"Do not recommend any songs already recommended, including: {previous_recommendations}. Please recommend a random song. It can be from any genre and any decade. I want all different recommendation. Again, do not repeat recommended songs."}
-                        ])
-                    if response.choices:
-                        new_recommendation = response.choices[0].message.content.strip()
-                        print('recommendation added to table:', new_recommendation)
-                        await interaction.followup.send(f"AI Recommendations:\n{new_recommendation}")
-                        add_recommendation(user_id, 'random', new_recommendation)
-                    else:
-                        await interaction.followup.send("Failed to generate recommendations. Please try again later.", ephemeral=True)
-                except Exception as e:
-                    await interaction.followup.send(f"Error occurred: {e}", ephemeral=True)
-                return
-
+            recommendation_type = search_type.lower()
+            history = await self.recommendation_index.history(user_id, recommendation_type)
+            # Only a fixed window of recent picks goes in the prompt; older repeats are caught by the index
+            previous_recommendations = list(history.recent)
             if search_type.lower() == "song":
                 recommendation_info = profile_info.top_songs
             elif search_type.lower() == "artist":
                 recommendation_info = profile_info.top_artists
-            elif search_type.lower() == "album":
-                recommendation_info = profile_info.top_songs  # Placeholder, should be updated with albums
+            else:
+                recommendation_info = profile_info.top_songs  # Placeholder for albums, should be updated with albums
+
+            def build_messages():
+                if recommendation_type == 'random':
+                    return [
+                        {"role": "system", "content": "You are a music recommendation algorithm. Your task is to recommend a random song from any genre. Do not limit your recommendation to a single genre. Start your reply with the song on its own line as 'Title by Artist'."},
+                        {"role": "user", "content": "Recommend a song from any genre, culture, country, decade, time period, etc. Do not limit yourself to a single genre of songs. Please include musical diversity, but do not repeat recommended songs."},
+                        {"role": "user", "content": f"Do not recommend any songs already recommended, including: {previous_recommendations}. Please recommend a random song. It can be from any genre and any decade. I want all different recommendation. Again, do not repeat recommended songs."}
+                    ]
+                return [
+                    {"role": "system", "content": f"Recommend a {search_type.lower()} that is similar to the given {search_type.lower()}s in this information: {recommendation_info}. Start your reply with the {search_type.lower()} on its own line as 'Title by Artist' (just the name for an artist)."},
+                    {"role": "user", "content": f"Recommend a {search_type.lower()} based on the information given. Do not repeat these recommendations: {previous_recommendations}"}
+                ]
 
             try:
-                response = self.openai_client.chat.completions.create(
-                    model="gpt-4",
-                    messages=[
-                        {"role": "system", "content": f'Recommend a {search_type.lower()} that is similar to the given {search_type.lower()}s in this information: {recommendation_info}'},
-                        {"role": "user", "content": f"Recommend a {search_type.lower()} based on the information given. Do not repeat these recommendations: {previous_recommendations}"}
-                    ])
-                if response.choices:
-                    new_recommendation = response.choices[0].message.content.strip()
-                    await interaction.followup.send(f"AI Recommendations:\n{new_recommendation}")
-                    add_recommendation(user_id, search_type.lower(), new_recommendation)
+                message = None
+                for attempt in range(config.DISCOVER_MAX_ATTEMPTS):
+                    new_recommendation, message = await self.stream_to_followup(interaction, "AI Recommendations:\n", "gpt-4", build_messages(), message)
+                    if not new_recommendation or not history.contains(new_recommendation):
+                        break
+                    # Already recommended: show that we're retrying and steer the model away from it
+                    self.recommendation_index.collisions += 1
+                    previous_recommendations.append(describe(new_recommendation))
+                    if attempt + 1 < config.DISCOVER_MAX_ATTEMPTS:
+                        await message.edit(content=f"AI Recommendations:\nAlready recommended {describe(new_recommendation)}, finding something new...")
+
+                if new_recommendation:
+                    history.add(new_recommendation)
+                    await db.add_recommendation(user_id, recommendation_type, new_recommendation)
                     print('recommendation added to table:', new_recommendation)
                 else:
-                    await interaction.followup.send("Failed to generate recommendations. Please try again later.")
+                    await interaction.followup.send("Failed to generate recommendations. Please try again later.", ephemeral=True)
             except Exception as e:
-                await interaction.followup.send(f"Error occurred: {e}")
+                await interaction.followup.send(f"Error occurred: {e}", ephemeral=True)
 
 
 
         @self.tree.command(name='share_playlist', description="Share one of your Spotify playlists", guild=self.guild)
         @app_commands.describe(playlist_name="The name of the playlist you want to share")
+        @metrics.instrument_command
         async def share_playlist(interaction: discord.Interaction, playlist_name: str):
             user_id = str(interaction.user.id)
-            token_info = get_token(user_id)  # Retrieve the token from the database
+            token_info = await self.token_store.get(user_id)
             access_token = await self.get_fresh_token(token_info, user_id)
             if not access_token:
                 await interaction.response.send_message("Please authenticate with Spotify first using /authenticate_spotify.", ephemeral=True)
                 return
 
-            sp = spotipy.Spotify(auth=access_token)
             try:
-                playlist = await self.find_playlist_by_name(sp, playlist_name)
+                playlist = await self.find_playlist_by_name(access_token, playlist_name)
                 if playlist:
                     playlist_name = playlist['name']
                     playlist_description = playlist['description']
@@ -756,18 +913,19 @@ class SpotifyBot:
 
         @self.tree.command(name='playlist_create', description="Create a collaborative playlist for the server", guild=self.guild)
         @app_commands.describe(name="The name of the playlist", description="The description of the playlist")
+        @metrics.instrument_command
         async def playlist_create(interaction: discord.Interaction, name: str, description: str):
             user_id = str(interaction.user.id)
-            token_info = get_token(user_id)  # Retrieve the token from the database
+            token_info = await self.token_store.get(user_id)
             access_token = await self.get_fresh_token(token_info, user_id)
             if not access_token:
                 await interaction.response.send_message("Please authenticate with Spotify first using /authenticate_spotify.", ephemeral=True)
                 return
 
-            sp = spotipy.Spotify(auth=access_token)
-            user_profile = sp.current_user()
+            user_profile = await self.spotify_client.current_user(access_token)
             try:
-                playlist = sp.user_playlist_create(
+                playlist = await self.spotify_client.user_playlist_create(
+                    access_token,
                     user=user_profile['id'],
                     name=name,
                     public=False,  # To create a collaborative playlist, public must be False
@@ -775,42 +933,45 @@ class SpotifyBot:
                 )
                 playlist_id = playlist['id']
                 # Set the playlist to be collaborative
-                sp.playlist_change_details(playlist_id=playlist_id, collaborative=True)
+                await self.spotify_client.playlist_change_details(access_token, playlist_id=playlist_id, collaborative=True)
                 
                 # Add playlist to the database
                 playlist_url = playlist['external_urls']['spotify']
-                add_playlist_to_db(playlist_id, name, description, playlist_url, user_id)
+                await db.add_playlist_to_db(playlist_id, name, description, playlist_url, user_id)
                 await interaction.response.send_message(f"Collaborative playlist created: [Playlist Link]({playlist_url})")
             except spotipy.exceptions.SpotifyException as e:
                 await interaction.response.send_message(f"Failed to create playlist: {e}", ephemeral=True)
 
         @self.tree.command(name='playlist_add', description="Add a song to a collaborative playlist", guild=self.guild)
         @app_commands.describe(playlist_name="The name of the playlist", track_id="The link of the track to add")
+        @metrics.instrument_command
         async def playlist_add(interaction: discord.Interaction, playlist_name: str, track_id: str):
             user_id = str(interaction.user.id)
-            token_info = get_token(user_id)  # Retrieve the token from the database
+            token_info = await self.token_store.get(user_id)
             access_token = await self.get_fresh_token(token_info, user_id)
             if not access_token:
                 await interaction.response.send_message("Please authenticate with Spotify first using /authenticate_spotify.", ephemeral=True)
                 return
 
-            sp = spotipy.Spotify(auth=access_token)
-            
-            # Search for the playlist by name
-            playlists = fetch_all_playlists_from_db()
-            playlist_id = None
-            for playlist in playlists:
-                if playlist.name.lower() == playlist_name.lower():
-                    playlist_id = playlist.playlist_id  # Ensure this is treated as a string
-                    break
+            # Look up the playlist by case-folded name
+            playlist = await db.get_playlist_by_name(playlist_name)
+            playlist_id = playlist.playlist_id if playlist else None
 
             if not playlist_id:
                 await interaction.response.send_message(f"Playlist '{playlist_name}' not found.", ephemeral=True)
                 return
 
-            # Retrieve the track details using the track ID
+            track_id = parse_spotify_id(track_id, 'track')
+            if not track_id:
+                await interaction.response.send_message("That doesn't look like a Spotify track link.", ephemeral=True)
+                return
+
+            # Retrieve the track details from the local catalog, fetching them if we haven't seen the track
             try:
-                track = sp.track(track_id)
+                track = await self.catalog.get_track(self.spotify_client, access_token, track_id)
+                if not track:
+                    await interaction.response.send_message("Failed to retrieve track details: track not found.", ephemeral=True)
+                    return
                 track_name = track['name']
                 track_artists = ', '.join([artist['name'] for artist in track['artists']])
                 album_name = track['album']['name']
@@ -822,7 +983,7 @@ class SpotifyBot:
 
             # Add the track to the playlist
             try:
-                sp.playlist_add_items(playlist_id=playlist_id, items=[track_id])
+                await self.spotify_client.playlist_add_items(access_token, playlist_id=playlist_id, items=[track_id])
                 
                 # Create embed
                 embed = discord.Embed(
@@ -838,16 +999,96 @@ class SpotifyBot:
             except spotipy.exceptions.SpotifyException as e:
                 await interaction.response.send_message(f"Failed to add track: {e}", ephemeral=True)
 
+        @playlist_add.autocomplete('playlist_name')
+        async def playlist_name_autocomplete(interaction: discord.Interaction, current: str):
+            return await self.playlist_name_choices(current)
+
+        @self.tree.command(name='playlist_bulk_add', description="Add many songs, a playlist, or an album to a collaborative playlist", guild=self.guild)
+        @app_commands.describe(playlist_name="The name of the playlist", tracks="Track links separated by spaces or commas", source="A playlist or album link to copy every track from")
+        @metrics.instrument_command
+        async def playlist_bulk_add(interaction: discord.Interaction, playlist_name: str, tracks: str = None, source: str = None):
+            user_id = str(interaction.user.id)
+            token_info = await self.token_store.get(user_id)
+            access_token = await self.get_fresh_token(token_info, user_id)
+            if not access_token:
+                await interaction.response.send_message("Please authenticate with Spotify first using /authenticate_spotify.", ephemeral=True)
+                return
+
+            playlist = await db.get_playlist_by_name(playlist_name)
+            if not playlist:
+                await interaction.response.send_message(f"Playlist '{playlist_name}' not found.", ephemeral=True)
+                return
+            if not tracks and not source:
+                await interaction.response.send_message("Give me some track links or a playlist or album link to add.", ephemeral=True)
+                return
+
+            # Resolving and adding hundreds of tracks takes a while, so report progress on one deferred response
+            await interaction.response.defer()
+            links = [link for link in re.split(r'[\s,]+', tracks or '') if link]
+            track_ids = [parse_spotify_id(link, 'track') for link in links]
+            invalid = track_ids.count(None)
+            track_ids = [track_id for track_id in track_ids if track_id]
+
+            # The deferred response is public and shows progress, so errors replace it rather than
+            # going out as a separate followup
+            added = 0
+            try:
+                if source:
+                    # One past the cap is enough to know whether the source was cut short
+                    source_ids = await self.collect_source_track_ids(access_token, source, config.BULK_ADD_MAX_TRACKS + 1)
+                    if source_ids is None:
+                        await interaction.edit_original_response(content="The source must be a Spotify playlist or album link.")
+                        return
+                    track_ids += source_ids
+
+                track_ids = list(dict.fromkeys(track_ids))
+                truncated = len(track_ids) > config.BULK_ADD_MAX_TRACKS
+                track_ids = track_ids[:config.BULK_ADD_MAX_TRACKS]
+                await interaction.edit_original_response(content=f"Looking up {len(track_ids)} tracks...")
+                resolved = await self.catalog.get_tracks(self.spotify_client, access_token, track_ids)
+                found = [track for track in resolved if track]
+                not_found = len(resolved) - len(found)
+
+                for start in range(0, len(found), config.PLAYLIST_ADD_BATCH_SIZE):
+                    chunk = found[start:start + config.PLAYLIST_ADD_BATCH_SIZE]
+                    await self.spotify_client.playlist_add_items(access_token, playlist_id=playlist.playlist_id, items=[track['id'] for track in chunk])
+                    added += len(chunk)
+                    await interaction.edit_original_response(content=f"Added {added}/{len(found)} tracks to '{playlist.name}'...")
+            except spotipy.exceptions.SpotifyException as e:
+                progress = f" after adding {added}" if added else ""
+                await interaction.edit_original_response(content=f"Failed to add tracks to '{playlist.name}'{progress}: {e}")
+                return
+
+            reply = f"Added {len(found)} tracks to '{playlist.name}'."
+            if truncated:
+                reply += f" Only the first {config.BULK_ADD_MAX_TRACKS} tracks were added; the rest were left out."
+            if invalid:
+                reply += f" Skipped {invalid} links that weren't Spotify tracks."
+            if not_found:
+                reply += f" Skipped {not_found} tracks Spotify couldn't find."
+            embed = discord.Embed(title=playlist.name, url=playlist.playlist_url, color=discord.Color.green())
+            preview = [f"'{track['name']}' by {', '.join(artist['name'] for artist in track['artists'])}" for track in found[:10]]
+            if len(found) > 10:
+                preview.append(f"...and {len(found) - 10} more")
+            if preview:
+                embed.description = '\n'.join(preview)
+            await interaction.edit_original_response(content=reply, embed=embed)
+
+        @playlist_bulk_add.autocomplete('playlist_name')
+        async def playlist_bulk_add_name_autocomplete(interaction: discord.Interaction, current: str):
+            return await self.playlist_name_choices(current)
+
         @self.tree.command(name='playlists', description="Show a list of collaborative playlists", guild=self.guild)
+        @metrics.instrument_command
         async def playlists(interaction: discord.Interaction):
             user_id = str(interaction.user.id)
-            token_info = get_token(user_id)  # Retrieve the token from the database
+            token_info = await self.token_store.get(user_id)
             access_token = await self.get_fresh_token(token_info, user_id)
             if not access_token:
                 await interaction.response.send_message("Please authenticate with Spotify first using /authenticate_spotify.", ephemeral=True)
                 return
 
-            playlists = fetch_all_playlists_from_db()
+            playlists = await db.get_all_playlists()
             embed = discord.Embed(title="Collaborative Playlists", color=discord.Color.purple())
 
             for playlist in playlists:
@@ -856,15 +1097,18 @@ class SpotifyBot:
             await interaction.response.send_message(embed=embed)
 
     async def fetch_currently_playing(self, user_id: str):
-        token_info = get_token(user_id)  # Retrieve the token from the database
+        track_info = self.now_playing.lookup(user_id)
+        if track_info:
+            return track_info
+        token_info = await self.token_store.get(user_id)
         if token_info:
             access_token = await self.get_fresh_token(token_info, user_id)
             if access_token:
-                sp = spotipy.Spotify(auth=access_token)
                 try:
-                    current_track = sp.current_user_playing_track()
+                    current_track = await self.spotify_client.current_user_playing_track(access_token)
                     if current_track and current_track['item']:
                         track = current_track['item']
+                        self.catalog.add_track(track)
                         track_name = track['name']
                         artist_name = track['artists'][0]['name']
                         album_cover_url = track['album']['images'][0]['url'] if track['album']['images'] else None
@@ -879,21 +1123,95 @@ class SpotifyBot:
                     logging.error(f"Spotify API error for user {user_id}: {e}")
         return None
 
-    async def find_playlist_by_name(self, sp, playlist_name: str):
-            playlists = sp.current_user_playlists(limit=50)
+    async def stream_to_followup(self, interaction, prefix, model, messages, message=None):
+        # Post the first chunk as soon as it arrives (or reuse `message`), then keep editing it
+        shown = None
+        text = ''
+        last_edit = 0
+        async for piece in self.ai_client.stream(model, messages):
+            text += piece
+            now = time.monotonic()
+            if message is None:
+                shown = f"{prefix}{text}"[:2000]
+                message = await interaction.followup.send(shown, wait=True)
+                last_edit = now
+            elif now - last_edit >= config.DISCOVER_EDIT_INTERVAL:
+                shown = f"{prefix}{text}"[:2000]
+                await message.edit(content=shown)
+                last_edit = now
+        if message and f"{prefix}{text.strip()}"[:2000] != shown:
+            await message.edit(content=f"{prefix}{text.strip()}"[:2000])
+        return text.strip(), message
+
+    async def collect_source_track_ids(self, access_token, source, limit):
+        # Stops paging once it has limit distinct track ids
+        kind, source_id = parse_spotify_link(source)
+        track_ids = {}
+        if kind == 'playlist':
+            offset = 0
+            while True:
+                page = await self.spotify_client.playlist_items(access_token, source_id, limit=100, offset=offset)
+                for item in page['items']:
+                    # Playlist items are full track objects, so the catalog can skip fetching them
+                    self.catalog.add_track(item.get('track'))
+                    if item.get('track') and item['track'].get('id'):
+                        track_ids[item['track']['id']] = None
+                if len(track_ids) >= limit or not page.get('next') or not page['items']:
+                    return list(track_ids)[:limit]
+                offset += len(page['items'])
+        if kind == 'album':
+            offset = 0
+            while True:
+                page = await self.spotify_client.album_tracks(access_token, source_id, limit=50, offset=offset)
+                track_ids.update((track['id'], None) for track in page['items'] if track.get('id'))
+                if len(track_ids) >= limit or not page.get('next') or not page['items']:
+                    return list(track_ids)[:limit]
+                offset += len(page['items'])
+        return None
+
+    async def playlist_name_choices(self, current: str):
+        index = await db.get_playlist_name_index()
+        current = current.casefold()
+        # Prefix matches first, then names that contain what the user has typed so far
+        names = [playlist.name for key, playlist in index.items() if key.startswith(current)]
+        names += [playlist.name for key, playlist in index.items() if current in key and not key.startswith(current)]
+        # Discord allows at most 25 choices of up to 100 characters each
+        return [app_commands.Choice(name=name[:100], value=name[:100]) for name in names[:25]]
+
+    def build_listening_embed(self, listening_info, pending_count=0):
+        embed = discord.Embed(title="Currently Listening To", color=discord.Color.blue())
+        # Discord rejects embeds with more than 25 fields
+        for info in listening_info[:25]:
+            embed.add_field(
+                name=f"{info['member_name']} is listening to:",
+                value=f"[{info['track_name']} by {info['artist_name']}]({info['track_url']})",
+                inline=False
+            )
+            if info['album_cover_url']:
+                embed.set_thumbnail(url=info['album_cover_url'])
+        if pending_count:
+            embed.set_footer(text=f"Still checking {pending_count} more members...")
+        elif not listening_info:
+            embed.description = "No one is currently listening to anything on Spotify."
+        return embed
+
+    async def find_playlist_by_name(self, access_token, playlist_name: str):
+            playlists = await self.spotify_client.current_user_playlists(access_token, limit=50)
             for playlist in playlists['items']:
                 if playlist['name'].lower() == playlist_name.lower():
                     return playlist
             return None
 
     async def get_top_songs(self, access_token):
-        sp = spotipy.Spotify(auth=access_token)
-        top_tracks = sp.current_user_top_tracks(limit=5)
+        top_tracks = await self.spotify_client.current_user_top_tracks(access_token, limit=5)
+        for track in top_tracks['items']:
+            self.catalog.add_track(track)
         return [f"{track['name']} by {track['artists'][0]['name']}" for track in top_tracks['items']]
 
     async def get_top_artists(self, access_token):
-        sp = spotipy.Spotify(auth=access_token)
-        top_artists = sp.current_user_top_artists(limit=5)
+        top_artists = await self.spotify_client.current_user_top_artists(access_token, limit=5)
+        for artist in top_artists['items']:
+            self.catalog.add_artist(artist)
         return [artist['name'] for artist in top_artists['items']]
 
     # async def get_fresh_token(self, token_info, user_id):
@@ -917,30 +1235,37 @@ class SpotifyBot:
 
     async def get_fresh_token(self, token_info, user_id):
         if token_info and (token_info.expires_at - int(time.time()) < 60):
-            # Token needs refreshing
-            refresh_url = f"https://5c04-128-12-123-206.ngrok-free.app/refresh_token?refresh_token={token_info.refresh_token}"
-            response = requests.get(refresh_url)
-            if response.status_code == 200:
-                refreshed_token_info = response.json()
-                if 'expires_in' in refreshed_token_info:
-                    refreshed_token_info['expires_at'] = int(time.time()) + refreshed_token_info['expires_in']
-                else:
-                    logging.error(f"Response did not contain 'expires_in': {refreshed_token_info}")
-                    # Set a default expires_at if 'expires_in' is missing (assuming 1 hour lifespan)
-                    refreshed_token_info['expires_at'] = int(time.time()) + 3600
-                
-                # Ensure token_type is included
-                if 'token_type' not in refreshed_token_info:
-                    refreshed_token_info['token_type'] = 'Bearer'
+            # Token needs refreshing; normally token_refresher has already done this
+            return await self.refresh_access_token(token_info, user_id)
+        return token_info.access_token if token_info else None
 
-                save_token(user_id, refreshed_token_info)  # Save the refreshed token to the database
-                return refreshed_token_info['access_token']
+    async def refresh_access_token(self, token_info, user_id):
+        return await self.refresh_flight.do(str(user_id), self.request_token_refresh, token_info, user_id)
+
+    async def request_token_refresh(self, token_info, user_id):
+        refresh_url = f"{config.AUTH_SERVER_URL}/refresh_token?refresh_token={token_info.refresh_token}"
+        with metrics.timer('bot_external_call', service='token_refresh', operation='refresh'):
+            response = await self.spotify_client.get(refresh_url)
+        if response.status_code == 200:
+            refreshed_token_info = response.json()
+            if 'expires_in' in refreshed_token_info:
+                refreshed_token_info['expires_at'] = int(time.time()) + refreshed_token_info['expires_in']
             else:
-                logging.error(f"Failed to refresh token: {response.status_code} {response.text}")
-                return None
-        return token_info.access_token if token_info else None
+                logging.error(f"Response did not contain 'expires_in': {refreshed_token_info}")
+                # Set a default expires_at if 'expires_in' is missing (assuming 1 hour lifespan)
+                refreshed_token_info['expires_at'] = int(time.time()) + 3600
+            
+            # Ensure token_type is included
+            if 'token_type' not in refreshed_token_info:
+                refreshed_token_info['token_type'] = 'Bearer'
 
+            await self.token_store.save(user_id, refreshed_token_info)  # Update memory and write through to the database
+            return refreshed_token_info['access_token']
+        else:
+            logging.error(f"Failed to refresh token: {response.status_code} {response.text}")
+            return None
 
 
-client = ModBot()
-client.run(discord_token)
\ No newline at end of file
+if __name__ == '__main__':
+    client = ModBot()
+    client.run(discord_token, log_handler=None)  # Logging is already set up above
\ No newline at end of file
@@ -0,0 +1,66 @@
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    # Least-recently-used map whose entries also expire `ttl` seconds after they are set.
+    # A ttl of None keeps entries until they are pushed out by size.
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at is None or expires_at > time.time():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self.entries[key]
+            self.expirations += 1
+        self.misses += 1
+        return default
+
+    def set(self, key, value, ttl=None, expires_at=None):
+        ttl = self.ttl if ttl is None else ttl
+        if expires_at is None and ttl is not None:
+            expires_at = time.time() + ttl
+        self.entries[key] = (expires_at, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        entry = self.entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        self.entries.clear()
+
+    def __contains__(self, key):
+        entry = self.entries.get(key)
+        return entry is not None and (entry[0] is None or entry[0] > time.time())
+
+    def __len__(self):
+        return len(self.entries)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate(),
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
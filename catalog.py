@@ -0,0 +1,100 @@
+from cache import TTLCache
+from config import config
+import re
+
+SPOTIFY_LINK = re.compile(r'(?:spotify:|open\.spotify\.com/(?:intl-[\w-]+/)?)(track|album|artist|playlist)[:/]([A-Za-z0-9]{22})')
+SPOTIFY_ID = re.compile(r'[A-Za-z0-9]{22}')
+
+# Largest batch each multi-ID endpoint accepts
+TRACK_BATCH_SIZE = 50
+ALBUM_BATCH_SIZE = 20
+ARTIST_BATCH_SIZE = 50
+
+
+def parse_spotify_link(value):
+    # Returns (kind, id) for a spotify: URI or an open.spotify.com link
+    match = SPOTIFY_LINK.search(value.strip())
+    return (match.group(1), match.group(2)) if match else (None, None)
+
+
+def parse_spotify_id(value, kind=None):
+    # Accepts a bare ID, a spotify: URI or an open.spotify.com link
+    value = value.strip()
+    link_kind, item_id = parse_spotify_link(value)
+    if item_id:
+        return item_id if kind is None or link_kind == kind else None
+    return value if SPOTIFY_ID.fullmatch(value) else None
+
+
+def compact(item):
+    # available_markets is a list of ~180 country codes on every track and album
+    return {key: value for key, value in item.items() if key != 'available_markets'}
+
+
+class SpotifyCatalog:
+    # Tracks, albums and artists keyed by Spotify ID, filled from every API response the bot
+    # already receives. Misses are fetched through the multi-ID endpoints in batches.
+    def __init__(self, maxsize=config.CATALOG_SIZE):
+        self.tracks = TTLCache(maxsize)
+        self.albums = TTLCache(maxsize)
+        self.artists = TTLCache(maxsize)
+        self.batch_calls = 0
+
+    def add_track(self, track):
+        # Local files and podcast episodes have no track ID
+        if not track or not track.get('id') or track.get('type', 'track') != 'track':
+            return
+        track = compact(track)
+        track['album'] = compact(track.get('album') or {})
+        self.tracks.set(track['id'], track)
+        # Tracks embed simplified albums and artists; keep them unless we already have one
+        if track['album'].get('id') and track['album']['id'] not in self.albums:
+            self.albums.set(track['album']['id'], track['album'])
+        for artist in track.get('artists', []):
+            if artist.get('id') and artist['id'] not in self.artists:
+                self.artists.set(artist['id'], artist)
+
+    def add_album(self, album):
+        if album and album.get('id'):
+            self.albums.set(album['id'], compact(album))
+
+    def add_artist(self, artist):
+        if artist and artist.get('id'):
+            self.artists.set(artist['id'], artist)
+
+    def add_search_results(self, results):
+        for track in (results.get('tracks') or {}).get('items', []):
+            self.add_track(track)
+        for album in (results.get('albums') or {}).get('items', []):
+            self.add_album(album)
+        for artist in (results.get('artists') or {}).get('items', []):
+            self.add_artist(artist)
+
+    async def fetch_missing(self, store, ids, fetch, batch_size, key, add):
+        missing = [item_id for item_id in dict.fromkeys(ids) if item_id not in store]
+        for start in range(0, len(missing), batch_size):
+            response = await fetch(missing[start:start + batch_size])
+            self.batch_calls += 1
+            for item in response[key]:
+                add(item)
+        return [store.get(item_id) for item_id in ids]
+
+    async def get_tracks(self, spotify_client, access_token, track_ids):
+        return await self.fetch_missing(self.tracks, track_ids, lambda ids: spotify_client.tracks(access_token, ids), TRACK_BATCH_SIZE, 'tracks', self.add_track)
+
+    async def get_albums(self, spotify_client, access_token, album_ids):
+        return await self.fetch_missing(self.albums, album_ids, lambda ids: spotify_client.albums(access_token, ids), ALBUM_BATCH_SIZE, 'albums', self.add_album)
+
+    async def get_artists(self, spotify_client, access_token, artist_ids):
+        return await self.fetch_missing(self.artists, artist_ids, lambda ids: spotify_client.artists(access_token, ids), ARTIST_BATCH_SIZE, 'artists', self.add_artist)
+
+    async def get_track(self, spotify_client, access_token, track_id):
+        return (await self.get_tracks(spotify_client, access_token, [track_id]))[0]
+
+    def stats(self):
+        return {
+            'tracks': self.tracks.stats(),
+            'albums': self.albums.stats(),
+            'artists': self.artists.stats(),
+            'batch_calls': self.batch_calls,
+        }
@@ -0,0 +1,103 @@
+# Spotify API
+SPOTIFY_MAX_WORKERS = 16  # Threads available for blocking Spotify/HTTP calls
+
+# /listening
+LISTENING_CONCURRENCY = 20  # Spotify polls allowed in flight at once
+LISTENING_DEADLINE = 2.5  # Seconds after the interaction was created by which it gets answered
+LISTENING_MAX_WAIT = 30  # Seconds to keep updating the embed with late results
+LISTENING_EDIT_INTERVAL = 1.0  # Minimum seconds between embed edits
+
+# Moderation
+MODERATION_BATCH_WINDOW = 0.05  # Seconds to collect messages before sending a batch
+MODERATION_MAX_BATCH_SIZE = 32  # Inputs per moderation request
+MODERATION_MAX_QUEUE_SIZE = 1000  # Messages waiting for moderation before callers block
+MODERATION_MAX_IN_FLIGHT = 4  # Batches awaiting a response at once
+MODERATION_CACHE_SIZE = 10000  # Cached verdicts, keyed by normalized message content
+MODERATION_CACHE_TTL = 3600  # Seconds before a cached verdict is re-checked
+
+# Spotify tokens
+TOKEN_STORE_MISS_TTL = 60  # Seconds to remember that a user has no token before checking the DB again
+TOKEN_STORE_REAUTH_WINDOW = 600  # Seconds to read a user's token from the DB after they run /authenticate
+TOKEN_REFRESH_LEAD_TIME = 300  # Seconds before expiry that the background refresher renews a token
+TOKEN_REFRESH_JITTER = 120  # Extra random lead so refreshes for tokens issued together are spread out
+TOKEN_REFRESH_CONCURRENCY = 4  # Background refreshes allowed in flight at once
+TOKEN_REFRESH_RETRY_DELAY = 30  # Seconds before retrying a failed background refresh
+
+# Outbound HTTP
+HTTP_POOL_CONNECTIONS = 10  # Hosts to keep connection pools for
+HTTP_POOL_MAXSIZE = 32  # Keep-alive connections per host; keep this >= SPOTIFY_MAX_WORKERS
+HTTP_CONNECT_TIMEOUT = 3.05  # Seconds
+HTTP_READ_TIMEOUT = 10  # Seconds
+HTTP_RETRIES = 3  # Retries for connection errors and 429/5xx responses
+
+# Now playing
+NOW_PLAYING_TTL = 900  # Seconds a presence entry without an end time is trusted
+NOW_PLAYING_END_GRACE = 15  # Seconds past a track's end before its presence entry counts as stale
+
+# Database
+DB_MAX_WORKERS = 4  # Threads running SQLite queries off the event loop
+
+# /recommend search cache
+SEARCH_CACHE_SIZE = 5000  # Search results kept in memory
+SEARCH_CACHE_TTL = 7 * 24 * 3600  # Seconds before a cached search is repeated against Spotify
+
+# Spotify catalog
+CATALOG_SIZE = 20000  # Tracks, albums and artists (each) kept in the local catalog
+
+# /playlist_bulk_add
+BULK_ADD_MAX_TRACKS = 1000  # Tracks accepted in a single bulk add
+PLAYLIST_ADD_BATCH_SIZE = 100  # Most tracks Spotify accepts per playlist_add_items call
+
+# OpenAI
+OPENAI_MAX_CONCURRENCY = 8  # Chat completions allowed in flight at once
+OPENAI_TIMEOUT = 30  # Seconds per chat completion call
+DISCOVER_EDIT_INTERVAL = 0.75  # Minimum seconds between edits while streaming /discover
+DISCOVER_PROMPT_WINDOW = 10  # Most recent recommendations the /discover prompt asks the model to avoid
+DISCOVER_MAX_ATTEMPTS = 3  # Generations tried before accepting a repeated recommendation
+DISCOVER_HISTORY_USERS = 5000  # Users whose recommendation history is kept in memory
+
+# Trivia
+TRIVIA_POOL_LOW_WATERMARK = 3  # Refill the question pool when fewer unused questions remain
+TRIVIA_POOL_TARGET = 10  # Unused questions to have on hand after a refill
+
+# Scheduler
+SCHEDULER_TIMEZONE = 'US/Pacific'
+SCHEDULER_CATCH_UP_WINDOW = 6 * 3600  # Seconds after a missed daily run during which it is still run on startup
+SCHEDULER_MAX_SLEEP = 60  # Seconds between clock checks while waiting for the next job
+
+# Outbound Discord actions
+OUTBOUND_COALESCE_WINDOW = 0.05  # Seconds to collect sends to the same channel into one message
+OUTBOUND_ROUTE_CONCURRENCY = 4  # Concurrent requests per Discord route (action + channel)
+DISCORD_MESSAGE_LIMIT = 2000
+
+# DM sessions
+SESSION_MAX_SIZE = 10000  # Users with an in-memory DM session; the least recently active are evicted first
+SESSION_TTL = 24 * 3600  # Seconds of inactivity before a DM session (and its in-progress flow) is dropped
+SESSION_PERSIST = True  # Keep in-progress DM flows in SQLite so they survive restarts
+
+# Music profiles
+PROFILE_CACHE_SIZE = 10000  # Rendered profiles kept in memory; entries change only when a profile is saved
+
+# Metrics
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 8889  # Prometheus scrape endpoint, next to flash_server on 8888
+METRICS_LOG_INTERVAL = 300  # Seconds between metric summaries in the log
+
+# Logging
+LOG_FILE = 'discord.log'
+LOG_LEVEL = 'DEBUG'
+LOG_LOGGERS = ('discord', 'metrics')  # Loggers routed to the log file
+LOG_FORMAT = 'text'  # 'text' or 'json' (one JSON object per line)
+LOG_ROTATION = 'size'  # 'size' or 'time'
+LOG_MAX_BYTES = 10 * 1024 * 1024  # Size rotation threshold
+LOG_ROTATE_WHEN = 'midnight'  # Time rotation interval, as for TimedRotatingFileHandler
+LOG_BACKUP_COUNT = 5
+LOG_QUEUE_SIZE = 10000  # Records waiting for the writer thread; more are dropped rather than blocking
+LOG_SAMPLE_RATE = 50  # Records per second per logger below WARNING; 0 disables sampling
+LOG_CONSOLE = True  # Also echo records to stderr (from the writer thread)
+LOG_CONSOLE_LEVEL = 'INFO'  # What discord.py's default handler used to print; DEBUG goes to the file only
+
+# Endpoints (overridable so benchmarks can point the bot at local stand-ins)
+AUTH_SERVER_URL = 'https://5c04-128-12-123-206.ngrok-free.app'  # Public URL of flash_server: /login and /refresh_token
+SPOTIFY_API_URL = 'https://api.spotify.com/v1/'
+OPENAI_BASE_URL = None  # None uses the OpenAI default
@@ -1,11 +1,26 @@
-from sqlalchemy import create_engine, Column, String, Integer, JSON
+from sqlalchemy import create_engine, event, Column, String, Integer, JSON, Index
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+import time
 
 Base = declarative_base()
 
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets the bot and flash_server read while the other writes; NORMAL sync is safe under WAL
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA cache_size=-20000")  # ~20 MB page cache
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.close()
+
 # Set up the database
 engine = create_engine('sqlite:///spotify_tokens.db')
+event.listen(engine, 'connect', set_sqlite_pragmas)
 Base.metadata.create_all(engine)
 
 # Create a session for SQLAlchemy
@@ -61,10 +76,91 @@ class Recommendation(Base):
     recommendation_type = Column(String, nullable=False)  # song, album, artist
     recommendation = Column(String, nullable=False)  # The name of the recommended item
 
+    __table_args__ = (
+        Index('ix_recommendations_user_type', 'user_id', 'recommendation_type'),
+    )
+
     def __repr__(self):
         return f"<Recommendation(user_id='{self.user_id}', recommendation_type='{self.recommendation_type}', recommendation='{self.recommendation}')>"
 
+class SearchResult(Base):
+    __tablename__ = 'spotify_search_cache'
+    cache_key = Column(String, primary_key=True)  # "<type>:<normalized query>"
+    results = Column(JSON, nullable=False)
+    fetched_at = Column(Integer, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<SearchResult(cache_key='{self.cache_key}', fetched_at={self.fetched_at})>"
+
+class TriviaQuestion(Base):
+    __tablename__ = 'trivia_questions'
+    id = Column(Integer, primary_key=True)
+    question_key = Column(String, unique=True, nullable=False)  # Normalized question, used to reject duplicates
+    question = Column(String, nullable=False)  # Question followed by its four options, as posted
+    options = Column(JSON, nullable=False)  # ["A) ...", "B) ...", "C) ...", "D) ..."]
+    answer = Column(String, nullable=False)  # A, B, C or D
+    created_at = Column(Integer, nullable=False)
+    used_at = Column(Integer, index=True)  # When it was posted; NULL while it's still in the pool
+
+    def __repr__(self):
+        return f"<TriviaQuestion(id={self.id}, answer='{self.answer}', used_at={self.used_at})>"
+
+class ScheduledJob(Base):
+    __tablename__ = 'scheduled_jobs'
+    name = Column(String, primary_key=True)
+    last_run_at = Column(Integer)  # Scheduled time (epoch seconds) of the last run that started
+
+    def __repr__(self):
+        return f"<ScheduledJob(name='{self.name}', last_run_at={self.last_run_at})>"
+
+class DMSession(Base):
+    __tablename__ = 'dm_sessions'
+    user_id = Column(String, primary_key=True)
+    state = Column(String)  # State member name, e.g. AWAITING_GENRES
+    data = Column(JSON)  # Flagged message and categories while a report is open
+    profile = Column(JSON)  # Music profile answers collected so far
+    touched_at = Column(Integer, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<DMSession(user_id='{self.user_id}', state='{self.state}', touched_at={self.touched_at})>"
+
+
 
+def fetch_all_tokens():
+    session = get_session()
+    try:
+        return session.query(SpotifyToken).all()
+    except Exception as e:
+        print(f"Error fetching tokens from DB: {e}")
+        return []
+    finally:
+        session.close()
+
+# Every CollaborativePlaylist row, plus case-folded name -> the first playlist with that
+# name (names aren't unique), loaded on first use and cleared whenever add_playlist_to_db
+# changes the table.
+playlist_rows = None
+playlist_name_index = None
+playlist_name_index_generation = 0
+
+def load_playlist_name_index():
+    global playlist_rows, playlist_name_index
+    generation = playlist_name_index_generation
+    rows = fetch_all_playlists_from_db()
+    index = {}
+    for playlist in rows:
+        index.setdefault(playlist.name.casefold(), playlist)
+    # Don't publish a map that a concurrent add_playlist_to_db has already made stale
+    if generation == playlist_name_index_generation:
+        playlist_rows = rows
+        playlist_name_index = index
+    return rows, index
+
+def invalidate_playlist_name_index():
+    global playlist_rows, playlist_name_index, playlist_name_index_generation
+    playlist_name_index_generation += 1
+    playlist_rows = None
+    playlist_name_index = None
 
 def add_playlist_to_db(playlist_id, name, description, playlist_url, user_id):
     session = get_session()
@@ -78,6 +174,7 @@ def add_playlist_to_db(playlist_id, name, description, playlist_url, user_id):
         )
         session.add(new_playlist)
         session.commit()
+        invalidate_playlist_name_index()
     except Exception as e:
         session.rollback()
         print(f"Error adding playlist to DB: {e}")
@@ -95,34 +192,25 @@ def fetch_all_playlists_from_db():
     finally:
         session.close()
 
+MUSIC_PROFILE_FIELDS = ('name', 'genres', 'artists', 'song', 'events', 'top_songs', 'top_artists')
+
 def save_music_profile(user_id, profile):
     session = get_session()
     try:
-        existing_profile = session.query(MusicProfile).filter_by(user_id=user_id).first()
-        if existing_profile:
-            existing_profile.name = profile['name']
-            existing_profile.genres = profile['genres']
-            existing_profile.artists = profile['artists']
-            existing_profile.song = profile['song']
-            existing_profile.events = profile['events']
-            existing_profile.top_songs = profile['top_songs']
-            existing_profile.top_artists = profile['top_artists']
-        else:
-            new_profile = MusicProfile(
-                user_id=user_id,
-                name=profile['name'],
-                genres=profile['genres'],
-                artists=profile['artists'],
-                song=profile['song'],
-                events=profile['events'],
-                top_songs=profile['top_songs'],
-                top_artists=profile['top_artists']
-            )
-            session.add(new_profile)
+        # Single INSERT ... ON CONFLICT DO UPDATE instead of a select followed by an update
+        values = {field: profile[field] for field in MUSIC_PROFILE_FIELDS}
+        statement = sqlite_insert(MusicProfile).values(user_id=str(user_id), **values)
+        statement = statement.on_conflict_do_update(
+            index_elements=['user_id'],
+            set_={field: statement.excluded[field] for field in MUSIC_PROFILE_FIELDS}
+        )
+        session.execute(statement)
         session.commit()
+        return True
     except Exception as e:
         session.rollback()
         print(f"Error saving music profile: {e}")
+        return False
     finally:
         session.close()
 
@@ -164,6 +252,157 @@ def get_recommendations(user_id, recommendation_type):
     finally:
         session.close()
 
+def create_indexes(bind=engine):
+    # create_all only adds indexes along with new tables, so existing databases need this
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind, checkfirst=True)
+
+def save_search_result(cache_key, results, fetched_at):
+    session = get_session()
+    try:
+        session.merge(SearchResult(cache_key=cache_key, results=results, fetched_at=fetched_at))
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        print(f"Error saving search result to DB: {e}")
+    finally:
+        session.close()
+
+def load_search_results(since, limit):
+    session = get_session()
+    try:
+        # Expired rows will never be served again, so drop them while we're here
+        session.query(SearchResult).filter(SearchResult.fetched_at < since).delete()
+        session.commit()
+        rows = session.query(SearchResult).order_by(SearchResult.fetched_at.desc()).limit(limit).all()
+        return [(row.cache_key, row.results, row.fetched_at) for row in rows]
+    except Exception as e:
+        session.rollback()
+        print(f"Error loading search results from DB: {e}")
+        return []
+    finally:
+        session.close()
+
+def add_trivia_question(question_key, question, options, answer):
+    session = get_session()
+    try:
+        session.add(TriviaQuestion(
+            question_key=question_key,
+            question=question,
+            options=options,
+            answer=answer,
+            created_at=int(time.time())
+        ))
+        session.commit()
+        return True
+    except IntegrityError:
+        session.rollback()
+        return False  # Already asked or already in the pool
+    except Exception as e:
+        session.rollback()
+        print(f"Error adding trivia question to DB: {e}")
+        return False
+    finally:
+        session.close()
+
+def count_unused_trivia_questions():
+    session = get_session()
+    try:
+        return session.query(TriviaQuestion).filter(TriviaQuestion.used_at.is_(None)).count()
+    except Exception as e:
+        print(f"Error counting trivia questions: {e}")
+        return 0
+    finally:
+        session.close()
+
+def take_trivia_question():
+    session = get_session()
+    try:
+        trivia = session.query(TriviaQuestion).filter(TriviaQuestion.used_at.is_(None)).order_by(TriviaQuestion.id).first()
+        if not trivia:
+            return None
+        taken = (trivia.question, trivia.options, trivia.answer)
+        trivia.used_at = int(time.time())
+        session.commit()
+        return taken
+    except Exception as e:
+        session.rollback()
+        print(f"Error taking trivia question from DB: {e}")
+        return None
+    finally:
+        session.close()
+
+def get_job_last_run(name):
+    session = get_session()
+    try:
+        job = session.query(ScheduledJob).filter_by(name=name).first()
+        return job.last_run_at if job else None
+    except Exception as e:
+        print(f"Error fetching last run of job {name}: {e}")
+        return None
+    finally:
+        session.close()
+
+def save_job_last_run(name, last_run_at):
+    session = get_session()
+    try:
+        session.merge(ScheduledJob(name=name, last_run_at=last_run_at))
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        print(f"Error saving last run of job {name}: {e}")
+    finally:
+        session.close()
+
+def save_dm_session(user_id, state, data, profile, touched_at):
+    session = get_session()
+    try:
+        session.merge(DMSession(user_id=str(user_id), state=state, data=data, profile=profile, touched_at=touched_at))
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        print(f"Error saving DM session for {user_id}: {e}")
+    finally:
+        session.close()
+
+def delete_dm_session(user_id):
+    session = get_session()
+    try:
+        session.query(DMSession).filter_by(user_id=str(user_id)).delete()
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        print(f"Error deleting DM session for {user_id}: {e}")
+    finally:
+        session.close()
+
+def get_dm_session(user_id, since):
+    session = get_session()
+    try:
+        row = session.query(DMSession).filter(DMSession.user_id == str(user_id), DMSession.touched_at >= since).first()
+        return (row.user_id, row.state, row.data, row.profile, row.touched_at) if row else None
+    except Exception as e:
+        print(f"Error fetching DM session for {user_id}: {e}")
+        return None
+    finally:
+        session.close()
+
+def load_dm_sessions(since, limit):
+    session = get_session()
+    try:
+        # Sessions idle past the TTL are abandoned flows, so drop them while we're here
+        session.query(DMSession).filter(DMSession.touched_at < since).delete()
+        session.commit()
+        rows = session.query(DMSession).order_by(DMSession.touched_at.desc()).limit(limit).all()
+        return [(row.user_id, row.state, row.data, row.profile, row.touched_at) for row in rows]
+    except Exception as e:
+        session.rollback()
+        print(f"Error loading DM sessions from DB: {e}")
+        return []
+    finally:
+        session.close()
+
 def initialize_database():
-    engine = create_engine('sqlite:///spotify_tokens.db')
-    Base.metadata.create_all(engine)
\ No newline at end of file
+    Base.metadata.create_all(engine)
+    create_indexes()
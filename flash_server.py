@@ -1,8 +1,8 @@
 from flask import Flask, request, redirect, session as flask_session, jsonify, url_for
 from database_setup import get_session, SpotifyToken
+from http_pool import PooledSession, http_session
 import json
 import os
-import requests
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 import base64
@@ -24,6 +24,10 @@ with open(token_path) as f:
     SPOTIPY_CLIENT_SECRET = tokens['spotify_client_secret']
     SPOTIPY_REDIRECT_URI = tokens['spotify_redirect_uri']
 
+# Authorization codes are single-use: re-POSTing one after a 5xx that Spotify had already
+# acted on gets invalid_grant and hides the real error, so only connection failures retry
+token_exchange_session = PooledSession(status_retries=0)
+
 def generate_random_string(length):
     return ''.join(random.choice(string.ascii_letters + string.digits) for _ in range(length))
 
@@ -74,7 +78,7 @@ def callback():
         }
     }
 
-    response = requests.post(auth_options['url'], data=auth_options['data'], headers=auth_options['headers'])
+    response = token_exchange_session.post(auth_options['url'], data=auth_options['data'], headers=auth_options['headers'])
     if response.status_code == 200:
         token_info = response.json()
         token_info['expires_at'] = int(time.time()) + token_info['expires_in']
@@ -105,7 +109,7 @@ def refresh_token():
         }
     }
 
-    response = requests.post(auth_options['url'], headers=auth_options['headers'], data=auth_options['data'])
+    response = http_session.post(auth_options['url'], headers=auth_options['headers'], data=auth_options['data'])
     if response.status_code == 200:
         response_data = response.json()
         access_token = response_data.get('access_token')
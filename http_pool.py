@@ -0,0 +1,45 @@
+from config import config
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class PooledSession(requests.Session):
+    # One keep-alive session per process for Spotify and OAuth traffic, so requests reuse
+    # open TCP/TLS connections instead of paying a new handshake each time.
+    def __init__(self, pool_connections=config.HTTP_POOL_CONNECTIONS, pool_maxsize=config.HTTP_POOL_MAXSIZE,
+                 timeout=(config.HTTP_CONNECT_TIMEOUT, config.HTTP_READ_TIMEOUT), retries=config.HTTP_RETRIES,
+                 status_retries=None):
+        super().__init__()
+        self.timeout = timeout
+        # Same retry policy spotipy builds for its private sessions, except that callers get the
+        # last response back once retries run out rather than a RetryError
+        retry = Retry(total=retries, connect=None, read=False, allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+                      status=retries if status_retries is None else status_retries, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504), raise_on_status=False)
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.mount('https://', self.adapter)
+        self.mount('http://', self.adapter)
+        self.requests_sent = 0
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        self.requests_sent += 1
+        return super().request(method, url, **kwargs)
+
+    def stats(self):
+        connections_opened = 0
+        pool_requests = 0
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool:
+                connections_opened += pool.num_connections
+                pool_requests += pool.num_requests
+        return {
+            'requests_sent': self.requests_sent,
+            'connections_opened': connections_opened,
+            'connection_reuse_rate': 1 - connections_opened / pool_requests if pool_requests else 0.0,
+        }
+
+
+http_session = PooledSession()
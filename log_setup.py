@@ -0,0 +1,99 @@
+import atexit
+from config import config
+import json
+import logging
+import logging.handlers
+import queue
+import time
+
+TEXT_FORMAT = '%(asctime)s:%(levelname)s:%(name)s: %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RateSampler(logging.Filter):
+    # Lets at most `rate` records per second through for each logger. WARNING and above
+    # always pass, so sampling only thins out debug/info chatter like gateway events.
+    def __init__(self, rate=config.LOG_SAMPLE_RATE):
+        super().__init__()
+        self.rate = rate
+        self.windows = {}  # logger name -> [second, records seen in it]
+        self.dropped = 0
+
+    def filter(self, record):
+        if not self.rate or record.levelno >= logging.WARNING:
+            return True
+        second = int(time.monotonic())
+        window = self.windows.get(record.name)
+        if window is None or window[0] != second:
+            window = self.windows[record.name] = [second, 0]
+        window[1] += 1
+        if window[1] > self.rate:
+            self.dropped += 1
+            return False
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    # Never block the event loop on a full queue; count the loss instead
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stats(self):
+        return {
+            'queued': self.queue.qsize(),
+            'dropped': self.dropped,
+            'sampled_out': sum(getattr(f, 'dropped', 0) for f in self.filters),
+        }
+
+
+def build_file_handler():
+    if config.LOG_ROTATION == 'time':
+        return logging.handlers.TimedRotatingFileHandler(config.LOG_FILE, when=config.LOG_ROTATE_WHEN,
+                                                         backupCount=config.LOG_BACKUP_COUNT, encoding='utf-8')
+    return logging.handlers.RotatingFileHandler(config.LOG_FILE, maxBytes=config.LOG_MAX_BYTES,
+                                                backupCount=config.LOG_BACKUP_COUNT, encoding='utf-8')
+
+
+def setup_logging(loggers=config.LOG_LOGGERS, level=config.LOG_LEVEL):
+    # Loggers only format and enqueue; a QueueListener thread does the file (and console) I/O
+    log_queue = queue.Queue(maxsize=config.LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(RateSampler())
+
+    file_handler = build_file_handler()
+    file_handler.setFormatter(JsonFormatter() if config.LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT))
+    handlers = [file_handler]
+    if config.LOG_CONSOLE:
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(config.LOG_CONSOLE_LEVEL)
+        console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        handlers.append(console_handler)
+
+    for name in loggers:
+        logger = logging.getLogger(name)
+        logger.setLevel(level)
+        logger.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener, queue_handler
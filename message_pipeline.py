@@ -0,0 +1,53 @@
+import time
+
+
+class MessageContext:
+    __slots__ = ('message', 'content', 'is_dm')
+
+    def __init__(self, message):
+        self.message = message
+        self.content = message.content.lower()  # Lowercased once for every stage
+        self.is_dm = message.guild is None
+
+
+class MessagePipeline:
+    # on_message runs each stage in order until one returns True to say the message is
+    # fully handled. Cheap checks go first so the common path exits before the expensive
+    # stages, and every stage's latency is recorded so slow ones show up in stats().
+    def __init__(self):
+        self.stages = []  # (name, stage)
+        self.timings = {}  # name -> [calls, total seconds, max seconds]
+        self.exits = {}  # name -> messages the stage finished
+
+    def add_stage(self, name, stage):
+        self.stages.append((name, stage))
+        self.timings[name] = [0, 0.0, 0.0]
+        self.exits[name] = 0
+
+    async def process(self, message):
+        context = MessageContext(message)
+        for name, stage in self.stages:
+            started = time.perf_counter()
+            try:
+                done = await stage(context)
+            finally:
+                elapsed = time.perf_counter() - started
+                timing = self.timings[name]
+                timing[0] += 1
+                timing[1] += elapsed
+                timing[2] = max(timing[2], elapsed)
+            if done:
+                self.exits[name] += 1
+                return name
+        return None
+
+    def stats(self):
+        return {
+            name: {
+                'calls': calls,
+                'exits': self.exits[name],
+                'avg_ms': total / calls * 1000 if calls else 0.0,
+                'max_ms': max_elapsed * 1000,
+            }
+            for name, (calls, total, max_elapsed) in self.timings.items()
+        }
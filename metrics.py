@@ -0,0 +1,209 @@
+import asyncio
+import bisect
+from config import config
+import functools
+import logging
+import re
+import time
+
+logger = logging.getLogger('metrics')
+
+# Latency buckets in seconds, upper bounds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def metric_name(*parts):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', '_'.join(str(part) for part in parts))
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Timer:
+    __slots__ = ('metrics', 'name', 'key', 'started')
+
+    def __init__(self, metrics, name, key):
+        self.metrics = metrics
+        self.name = name
+        self.key = key
+
+    def __enter__(self):
+        self.metrics.add_gauge(f'{self.name}_in_flight', 1, self.key)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe_key(f'{self.name}_seconds', time.perf_counter() - self.started, self.key)
+        self.metrics.add_gauge(f'{self.name}_in_flight', -1, self.key)
+        if exc_type is not None and not issubclass(exc_type, asyncio.CancelledError):
+            self.metrics.inc_key(f'{self.name}_errors_total', 1, self.key)
+        return False
+
+
+class Metrics:
+    # Counters, gauges and latency histograms kept in plain dicts keyed by (name, labels).
+    # Everything runs on the event loop, so no locking is needed. stats() methods of other
+    # components can be attached with add_collector and are exported as gauges.
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.collectors = {}  # prefix -> stats function
+        self.server = None
+
+    def inc_key(self, name, value, key):
+        series = self.counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + value
+
+    def add_gauge(self, name, value, key):
+        series = self.gauges.setdefault(name, {})
+        series[key] = series.get(key, 0) + value
+
+    def observe_key(self, name, value, key):
+        series = self.histograms.setdefault(name, {})
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram()
+        histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        self.inc_key(name, value, label_key(labels))
+
+    def set_gauge(self, name, value, **labels):
+        self.gauges.setdefault(name, {})[label_key(labels)] = value
+
+    def observe(self, name, value, **labels):
+        self.observe_key(name, value, label_key(labels))
+
+    def timer(self, name, **labels):
+        # with metrics.timer('bot_external_call', service='spotify', operation='search'): ...
+        # records <name>_seconds, <name>_in_flight and <name>_errors_total
+        return Timer(self, name, label_key(labels))
+
+    def instrument_command(self, func):
+        # Goes directly above a slash command's `async def`, below its tree/describe decorators
+        @functools.wraps(func)
+        async def wrapper(interaction, *args, **kwargs):
+            command = interaction.command.name if interaction.command else func.__name__
+            with self.timer('bot_command', command=command):
+                return await func(interaction, *args, **kwargs)
+        return wrapper
+
+    def add_collector(self, prefix, stats):
+        self.collectors[prefix] = stats
+
+    def collected(self):
+        values = {}
+
+        def flatten(parts, value):
+            if isinstance(value, dict):
+                for key, item in value.items():
+                    flatten(parts + (key,), item)
+            elif isinstance(value, (int, float)):
+                values[metric_name('bot', *parts)] = float(value)
+
+        for prefix, stats in self.collectors.items():
+            try:
+                flatten((prefix,), stats())
+            except Exception as e:
+                logger.error(f"Metrics collector {prefix} failed: {e}")
+        return values
+
+    def render(self):
+        # Prometheus text exposition format
+        lines = []
+        for name, series in sorted(self.counters.items()):
+            lines.append(f'# TYPE {name} counter')
+            lines.extend(f'{name}{format_labels(key)} {value}' for key, value in series.items())
+        for name, series in sorted(self.gauges.items()):
+            lines.append(f'# TYPE {name} gauge')
+            lines.extend(f'{name}{format_labels(key)} {value}' for key, value in series.items())
+        for name, value in sorted(self.collected().items()):
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {value}')
+        for name, series in sorted(self.histograms.items()):
+            lines.append(f'# TYPE {name} histogram')
+            for key, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{format_labels(key, (("le", bound),))} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(key)} {histogram.sum}')
+                lines.append(f'{name}_count{format_labels(key)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        lines = []
+        for name, series in sorted(self.histograms.items()):
+            errors = self.counters.get(name.replace('_seconds', '_errors_total'), {})
+            for key, histogram in sorted(series.items()):
+                lines.append(f"{name}{format_labels(key)} count={histogram.count} avg={histogram.sum / histogram.count:.3f}s "
+                             f"p50<={histogram.quantile(0.5)}s p95<={histogram.quantile(0.95)}s errors={errors.get(key, 0)}")
+        return lines
+
+    async def log_summary(self):
+        for line in self.summary():
+            logger.info(line)
+
+    async def serve(self, host=config.METRICS_HOST, port=config.METRICS_PORT):
+        if self.server is None:
+            self.server = await asyncio.start_server(self.handle_scrape, host, port)
+            print(f"Serving metrics on http://{host}:{port}/metrics")
+
+    async def handle_scrape(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.split()
+            if len(parts) > 1 and parts[1] == b'/metrics':
+                status, body = '200 OK', self.render().encode()
+            else:
+                status, body = '404 Not Found', b'Not found\n'
+            writer.write(f'HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body)
+            await writer.drain()
+        except Exception as e:
+            logger.error(f"Metrics scrape failed: {e}")
+        finally:
+            writer.close()
+
+    def close(self):
+        if self.server:
+            self.server.close()
+            self.server = None
+
+
+metrics = Metrics()
@@ -1,6 +1,7 @@
 # initialize_db.py
-from database_setup import engine, Base
+from database_setup import engine, Base, create_indexes
 
 # Create all tables
 Base.metadata.create_all(engine)
+create_indexes()
 print("All tables created successfully.")
@@ -0,0 +1,131 @@
+import asyncio
+from cache import TTLCache
+import hashlib
+import logging
+from metrics import metrics
+from tasks import spawn
+import time
+from config import config
+
+
+def moderation_key(text):
+    # Case and whitespace don't change a verdict, so "LOL" and " lol " share an entry
+    normalized = ' '.join(text.casefold().split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class ModerationBatcher:
+    # Collects messages over a short window and sends them to the moderation endpoint
+    # as one request, then hands each waiting caller its own verdict.
+    def __init__(self, openai_client, window=config.MODERATION_BATCH_WINDOW, max_batch_size=config.MODERATION_MAX_BATCH_SIZE,
+                 max_queue_size=config.MODERATION_MAX_QUEUE_SIZE, max_in_flight=config.MODERATION_MAX_IN_FLIGHT,
+                 cache_size=config.MODERATION_CACHE_SIZE, cache_ttl=config.MODERATION_CACHE_TTL):
+        self.openai_client = openai_client
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.queue = asyncio.Queue(maxsize=max_queue_size)
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.worker = None
+        self.sending = set()  # Batch tasks in flight
+        self.cache = TTLCache(cache_size, cache_ttl)
+        self.pending = {}  # content hash -> future shared by identical messages already queued
+
+        # Backpressure metrics
+        self.submitted = 0
+        self.coalesced = 0  # Cache misses that joined an identical message already queued
+        self.batches_sent = 0
+        self.inputs_sent = 0
+        self.errors = 0
+        self.blocked_submits = 0  # Submits that found the queue full and had to wait
+        self.enqueue_wait_total = 0.0
+        self.max_queue_depth = 0
+
+    def start(self):
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.worker:
+            self.worker.cancel()
+            self.worker = None
+
+    async def check(self, text):
+        key = moderation_key(text)
+        verdict = self.cache.get(key)
+        if verdict is not None:
+            return verdict
+        if key in self.pending:
+            self.coalesced += 1
+            return await asyncio.shield(self.pending[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending[key] = future
+        enqueued = False
+        try:
+            self.submitted += 1
+            if self.queue.full():
+                self.blocked_submits += 1
+            started = time.monotonic()
+            await self.queue.put((text, future))
+            enqueued = True
+            self.enqueue_wait_total += time.monotonic() - started
+            self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+            verdict = await asyncio.shield(future)
+        finally:
+            if not enqueued and not future.done():
+                future.cancel()
+            if self.pending.get(key) is future:
+                del self.pending[key]
+        self.cache.set(key, verdict)
+        return verdict
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            # Waiting here stops the queue from draining, which pushes back on check()
+            await self.in_flight.acquire()
+            spawn(self.send_batch(batch), self.sending)
+
+    async def send_batch(self, batch):
+        try:
+            with metrics.timer('bot_external_call', service='openai', operation='moderation'):
+                response = await self.openai_client.moderations.create(input=[text for text, _ in batch])
+        except Exception as e:
+            self.errors += 1
+            logging.error(f"Moderation batch of {len(batch)} failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.in_flight.release()
+
+        self.batches_sent += 1
+        self.inputs_sent += len(batch)
+        for (_, future), result in zip(batch, response.results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue.qsize(),
+            'max_queue_depth': self.max_queue_depth,
+            'submitted': self.submitted,
+            'coalesced': self.coalesced,
+            'blocked_submits': self.blocked_submits,
+            'enqueue_wait_total': self.enqueue_wait_total,
+            'batches_sent': self.batches_sent,
+            'avg_batch_size': self.inputs_sent / self.batches_sent if self.batches_sent else 0.0,
+            'errors': self.errors,
+            'cache': self.cache.stats(),
+        }
@@ -0,0 +1,53 @@
+from config import config
+import discord
+import time
+
+
+class NowPlayingIndex:
+    # What each member is playing according to their Discord presence. Discord sends a
+    # presence update whenever a linked Spotify account changes track, so fresh entries can
+    # answer /listening and /currently_playing without asking the Spotify API.
+    def __init__(self, ttl=config.NOW_PLAYING_TTL, end_grace=config.NOW_PLAYING_END_GRACE):
+        self.entries = {}  # user_id -> (track_info, updated_at, ends_at)
+        self.ttl = ttl
+        self.end_grace = end_grace
+        self.hits = 0
+        self.misses = 0
+
+    def update_from_member(self, member):
+        activity = next((activity for activity in member.activities if isinstance(activity, discord.Spotify)), None)
+        user_id = str(member.id)
+        if activity is None:
+            # No Spotify presence doesn't mean nothing is playing; the account may not be
+            # linked to Discord, so fall back to the API for this user.
+            self.entries.pop(user_id, None)
+            return
+        track_info = {
+            "track_name": activity.title,
+            "artist_name": activity.artists[0] if activity.artists else activity.artist,
+            "album_cover_url": activity.album_cover_url,
+            "track_url": activity.track_url
+        }
+        ends_at = activity.end.timestamp() if activity.end else None
+        self.entries[user_id] = (track_info, time.time(), ends_at)
+
+    def lookup(self, user_id):
+        entry = self.entries.get(str(user_id))
+        if entry and not self.is_stale(entry):
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        return None
+
+    def is_stale(self, entry):
+        _, updated_at, ends_at = entry
+        now = time.time()
+        if ends_at:
+            return now > ends_at + self.end_grace
+        return now - updated_at > self.ttl
+
+    def playing(self):
+        return [(user_id, entry[0]) for user_id, entry in self.entries.items() if not self.is_stale(entry)]
+
+    def stats(self):
+        return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
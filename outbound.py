@@ -0,0 +1,107 @@
+import asyncio
+from config import config
+from tasks import spawn
+import time
+
+
+class SendBatch:
+    __slots__ = ('channel', 'parts', 'length', 'future')
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.parts = []
+        self.length = 0
+        self.future = asyncio.get_running_loop().create_future()
+
+    def fits(self, content):
+        return not self.parts or self.length + 1 + len(content) <= config.DISCORD_MESSAGE_LIMIT
+
+    def add(self, content):
+        self.length += len(content) + (1 if self.parts else 0)
+        self.parts.append(content)
+
+
+class OutboundPipeline:
+    # Discord rate-limits per route (roughly: action + channel). Actions on different routes
+    # can go out concurrently, while each route gets a small semaphore so bursts queue here
+    # instead of turning into 429s. Sends to the same channel that arrive within
+    # OUTBOUND_COALESCE_WINDOW are merged into a single message. Daily threads keep creating
+    # new routes, so a route's semaphore is dropped once nothing is using it and delay stats
+    # are kept per action rather than per route.
+    def __init__(self, route_concurrency=config.OUTBOUND_ROUTE_CONCURRENCY, coalesce_window=config.OUTBOUND_COALESCE_WINDOW):
+        self.route_concurrency = route_concurrency
+        self.coalesce_window = coalesce_window
+        self.routes = {}  # route -> [Semaphore, callers holding or waiting on it]
+        self.delays = {}  # action -> [actions, total queueing delay, max queueing delay]
+        self.pending = {}  # channel id -> SendBatch still collecting
+        self.flushing = set()  # flush_later tasks in flight
+        self.sends = 0
+        self.coalesced = 0
+
+    async def run(self, route, func, *args, concurrency=None, **kwargs):
+        entry = self.routes.get(route)
+        if entry is None:
+            entry = self.routes[route] = [asyncio.Semaphore(concurrency or self.route_concurrency), 0]
+        entry[1] += 1
+        queued_at = time.perf_counter()
+        try:
+            async with entry[0]:
+                self.record_delay(route[0], time.perf_counter() - queued_at)
+                return await func(*args, **kwargs)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self.routes[route]
+
+    def record_delay(self, action, delay):
+        stats = self.delays.setdefault(action, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += delay
+        stats[2] = max(stats[2], delay)
+
+    async def send(self, channel, content):
+        # Every caller whose content went into the same batch gets the same Message back
+        self.sends += 1
+        batch = self.pending.get(channel.id)
+        if batch is None or not batch.fits(content):
+            batch = self.pending[channel.id] = SendBatch(channel)
+            spawn(self.flush_later(batch), self.flushing)
+        else:
+            self.coalesced += 1
+        batch.add(content)
+        return await asyncio.shield(batch.future)
+
+    async def flush_later(self, batch):
+        await asyncio.sleep(self.coalesce_window)
+        if self.pending.get(batch.channel.id) is batch:
+            del self.pending[batch.channel.id]
+        try:
+            # One send at a time per channel keeps batches in the order they were started
+            message = await self.run(('send', batch.channel.id), batch.channel.send, '\n'.join(batch.parts), concurrency=1)
+            batch.future.set_result(message)
+        except Exception as e:
+            batch.future.set_exception(e)
+
+    async def unpin_all(self, channel):
+        pins = await self.run(('pins', channel.id), channel.pins)
+        await asyncio.gather(*(self.run(('unpin', channel.id), pin.unpin) for pin in pins))
+        return len(pins)
+
+    async def add_reactions(self, message, emojis):
+        # Reactions show up in the order they were added, so these stay sequential
+        for emoji in emojis:
+            await self.run(('reaction', message.channel.id), message.add_reaction, emoji, concurrency=1)
+
+    def stats(self):
+        return {
+            'sends': self.sends,
+            'coalesced': self.coalesced,
+            'active_routes': len(self.routes),
+            'actions': {
+                action: {'count': count, 'avg_delay': total / count, 'max_delay': max_delay}
+                for action, (count, total, max_delay) in self.delays.items()
+            },
+        }
+
+
+outbound = OutboundPipeline()
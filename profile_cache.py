@@ -0,0 +1,63 @@
+from async_db import db
+from cache import TTLCache
+from config import config
+from database_setup import MUSIC_PROFILE_FIELDS
+
+MISSING = object()
+
+
+class CachedProfile:
+    __slots__ = ('fields', 'top_songs', 'top_artists', 'body')
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.top_songs = fields.get('top_songs') or []
+        self.top_artists = fields.get('top_artists') or []
+        # Everything but the "Music Profile for <display name>" header, which is added when sent
+        self.body = ''.join((
+            f"**Preferred Name:** {fields['name']}\n",
+            f"**Favorite Genres:** {fields['genres']}\n",
+            f"**Favorite Artists:** {fields['artists']}\n",
+            f"**Most played song right now:** {fields['song']}\n",
+            f"**Upcoming music events they're attending:** {fields['events']}\n",
+            "**Top 5 Songs:**\n", "\n".join(self.top_songs), "\n",
+            "**Top 5 Artists:**\n", "\n".join(self.top_artists),
+        ))
+
+    def render(self, display_name):
+        return f"**Music Profile for {display_name}:**\n{self.body}"
+
+
+class ProfileCache:
+    # Music profiles only change through save(), so cached entries (including "no profile"
+    # for users who haven't made one) never expire; they are replaced when the user saves.
+    def __init__(self, maxsize=config.PROFILE_CACHE_SIZE):
+        self.profiles = TTLCache(maxsize)
+        self.generation = 0
+
+    async def get(self, user_id):
+        key = str(user_id)
+        cached = self.profiles.get(key, MISSING)
+        if cached is not MISSING:
+            return cached
+        generation = self.generation
+        profile = await db.get_music_profile(key)
+        cached = CachedProfile({field: getattr(profile, field) for field in MUSIC_PROFILE_FIELDS}) if profile else None
+        # A save that landed while we were reading wins
+        if generation == self.generation:
+            self.profiles.set(key, cached)
+        return cached
+
+    async def save(self, user_id, profile):
+        key = str(user_id)
+        saved = await db.save_music_profile(key, profile)
+        self.generation += 1
+        if saved:
+            cached = CachedProfile({field: profile[field] for field in MUSIC_PROFILE_FIELDS})
+            self.profiles.set(key, cached)
+            return cached
+        self.profiles.pop(key)
+        return None
+
+    def stats(self):
+        return self.profiles.stats()
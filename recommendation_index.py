@@ -0,0 +1,69 @@
+from async_db import db
+from cache import TTLCache
+from collections import deque
+from config import config
+import re
+
+TITLE_BY_ARTIST = re.compile(r'^(.*?)\s+(?:by|-|–|—)\s+(.*)$', re.IGNORECASE)
+
+
+def split_recommendation(text):
+    # The prompt asks for "Title by Artist" on the first line; tolerate quotes, bold and numbering
+    line = next((line for line in text.strip().splitlines() if line.strip()), '')
+    line = re.sub(r'^\s*(?:\d+[.)]\s*)?', '', line).replace('**', '').strip()
+    match = TITLE_BY_ARTIST.match(line)
+    title, artist = match.groups() if match else (line, '')
+    return title.strip(' "\'“”'), artist.strip(' "\'“”.')
+
+
+def normalize(value):
+    value = re.sub(r'\((?:feat|ft|with)\.?[^)]*\)', '', value.casefold())
+    return ' '.join(re.sub(r'[^\w\s]', ' ', value).split())
+
+
+def recommendation_key(text):
+    title, artist = split_recommendation(text)
+    return f"{normalize(title)}|{normalize(artist)}"
+
+
+def describe(text):
+    title, artist = split_recommendation(text)
+    return f"{title} by {artist}" if artist else title
+
+
+class RecommendationHistory:
+    __slots__ = ('keys', 'recent')
+
+    def __init__(self, recommendations, window):
+        self.keys = {recommendation_key(text) for text in recommendations}
+        self.recent = deque((describe(text) for text in recommendations), maxlen=window)
+
+    def contains(self, text):
+        return recommendation_key(text) in self.keys
+
+    def add(self, text):
+        self.keys.add(recommendation_key(text))
+        self.recent.append(describe(text))
+
+
+class RecommendationIndex:
+    # Everything a user has been recommended, per type, normalized by title and artist so
+    # repeats can be caught locally. The prompt only carries a fixed window of recent items,
+    # so it stays the same size no matter how long the history gets.
+    def __init__(self, window=config.DISCOVER_PROMPT_WINDOW, maxsize=config.DISCOVER_HISTORY_USERS):
+        self.histories = TTLCache(maxsize)  # (user_id, recommendation_type) -> RecommendationHistory
+        self.window = window
+        self.collisions = 0  # Model picks rejected because the user already had them
+
+    async def history(self, user_id, recommendation_type):
+        key = (str(user_id), recommendation_type)
+        history = self.histories.get(key)
+        if history is None:
+            history = RecommendationHistory(await db.get_recommendations(str(user_id), recommendation_type), self.window)
+            self.histories.set(key, history)
+        return history
+
+    def stats(self):
+        stats = self.histories.stats()
+        stats['collisions'] = self.collisions
+        return stats
@@ -0,0 +1,159 @@
+from async_db import db
+import asyncio
+from config import config
+from datetime import datetime, timedelta
+import heapq
+import itertools
+import logging
+import pytz
+from tasks import spawn
+import time
+
+
+class Job:
+    # Runs daily at hour:minute in `timezone`, or every `interval` seconds
+    def __init__(self, name, func, hour=None, minute=0, interval=None, timezone=config.SCHEDULER_TIMEZONE):
+        self.name = name
+        self.func = func
+        self.hour = hour
+        self.minute = minute
+        self.interval = interval
+        self.timezone = pytz.timezone(timezone)
+        self.last_run_at = None
+        self.next_run_at = None
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.last_duration = 0.0
+        self.total_duration = 0.0
+
+    def daily_at(self, day):
+        # localize picks the right UTC offset for that date, so DST changes don't shift the job
+        return self.timezone.localize(datetime(day.year, day.month, day.day, self.hour, self.minute)).timestamp()
+
+    def next_after(self, after):
+        if self.interval:
+            return after + self.interval
+        today = datetime.fromtimestamp(after, self.timezone).date()
+        run_at = self.daily_at(today)
+        return run_at if run_at > after else self.daily_at(today + timedelta(days=1))
+
+    def previous_due(self, now):
+        if self.interval:
+            return self.last_run_at + self.interval if self.last_run_at else None
+        today = datetime.fromtimestamp(now, self.timezone).date()
+        run_at = self.daily_at(today)
+        return run_at if run_at <= now else self.daily_at(today - timedelta(days=1))
+
+    def stats(self):
+        return {
+            'runs': self.runs,
+            'failures': self.failures,
+            'skipped': self.skipped,
+            'last_lag': self.last_lag,
+            'max_lag': self.max_lag,
+            'last_duration': self.last_duration,
+            'avg_duration': self.total_duration / self.runs if self.runs else 0.0,
+            'last_run_at': self.last_run_at,
+            'next_run_at': self.next_run_at,
+        }
+
+
+class Scheduler:
+    # One heap of upcoming runs for every recurring job. Last-run times are persisted, so a
+    # run missed while the bot was down is caught up on startup, and registering the same
+    # job again (e.g. when on_ready fires after a reconnect) just replaces it.
+    def __init__(self, catch_up_window=config.SCHEDULER_CATCH_UP_WINDOW):
+        self.jobs = {}
+        self.heap = []  # (run_at, sequence, job name)
+        self.sequence = itertools.count()
+        self.catch_up_window = catch_up_window
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.executing = set()  # Job runs in flight
+
+    async def register(self, name, func, hour=None, minute=0, interval=None, timezone=config.SCHEDULER_TIMEZONE):
+        job = self.jobs.get(name)
+        if job:
+            # Update the job in place: a run in progress still holds it and clears `running` when
+            # it finishes, and history and metrics carry over. Only the callable and timing change.
+            job.func = func
+            job.hour = hour
+            job.minute = minute
+            job.interval = interval
+            job.timezone = pytz.timezone(timezone)
+        else:
+            job = Job(name, func, hour=hour, minute=minute, interval=interval, timezone=timezone)
+            job.last_run_at = await db.get_job_last_run(name)
+
+        now = time.time()
+        missed = job.previous_due(now)
+        if missed is not None and job.last_run_at is not None and job.last_run_at < missed and now - missed <= self.catch_up_window:
+            job.next_run_at = missed  # Catch up right away
+        else:
+            job.next_run_at = job.next_after(now)
+        self.jobs[name] = job
+        self.push(job)
+        print(f"Scheduled job '{name}' for {datetime.fromtimestamp(job.next_run_at, job.timezone)}.")
+        return job
+
+    def push(self, job):
+        heapq.heappush(self.heap, (job.next_run_at, next(self.sequence), job.name))
+        self.wakeup.set()
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            now = time.time()
+            while self.heap and self.heap[0][0] <= now:
+                run_at, _, name = heapq.heappop(self.heap)
+                job = self.jobs.get(name)
+                if not job or job.next_run_at != run_at:
+                    continue  # Replaced by a later registration
+                job.next_run_at = job.next_after(max(run_at, now))
+                self.push(job)
+                spawn(self.execute(job, run_at), self.executing)
+            # Wake up periodically anyway so a suspended host or clock change can't strand a job
+            timeout = config.SCHEDULER_MAX_SLEEP
+            if self.heap:
+                timeout = min(timeout, max(0, self.heap[0][0] - time.time()))
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def execute(self, job, run_at):
+        if job.running:
+            job.skipped += 1
+            return
+        job.running = True
+        started = time.time()
+        job.last_lag = started - run_at
+        job.max_lag = max(job.max_lag, job.last_lag)
+        job.last_run_at = run_at
+        await db.save_job_last_run(job.name, int(run_at))
+        try:
+            await job.func()
+        except Exception as e:
+            job.failures += 1
+            logging.error(f"Scheduled job '{job.name}' failed: {e}")
+        finally:
+            job.running = False
+            job.runs += 1
+            job.last_duration = time.time() - started
+            job.total_duration += job.last_duration
+
+    def stats(self):
+        return {name: job.stats() for name, job in self.jobs.items()}
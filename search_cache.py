@@ -0,0 +1,45 @@
+from async_db import db
+from cache import TTLCache
+from config import config
+from tasks import spawn
+import time
+
+
+def search_key(query, search_type):
+    return f"{search_type.strip().lower()}:{' '.join(query.casefold().split())}"
+
+
+class SearchCache:
+    # /recommend results keyed by normalized (query, type). Entries live in memory with LRU
+    # eviction and a TTL, and are mirrored to SQLite so a restarted bot starts warm.
+    def __init__(self, maxsize=config.SEARCH_CACHE_SIZE, ttl=config.SEARCH_CACHE_TTL):
+        self.cache = TTLCache(maxsize, ttl)
+        self.ttl = ttl
+        self.spotify_calls = 0
+        self.pending_writes = set()
+
+    async def load(self):
+        rows = await db.load_search_results(int(time.time() - self.ttl), self.cache.maxsize)
+        # Rows come newest first; insert oldest first so the newest end up most recently used
+        for cache_key, results, fetched_at in reversed(rows):
+            self.cache.set(cache_key, results, expires_at=fetched_at + self.ttl)
+        print(f"Loaded {len(rows)} cached Spotify searches.")
+
+    async def search(self, spotify_client, access_token, query, search_type):
+        cache_key = search_key(query, search_type)
+        results = self.cache.get(cache_key)
+        if results is not None:
+            return results
+
+        results = await spotify_client.search(access_token, q=query, type=search_type, limit=1)
+        self.spotify_calls += 1
+        self.cache.set(cache_key, results)
+        # Persisting shouldn't hold up the reply
+        spawn(db.save_search_result(cache_key, results, int(time.time())), self.pending_writes)
+        return results
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats['spotify_calls'] = self.spotify_calls
+        stats['spotify_calls_saved'] = self.cache.hits
+        return stats
@@ -0,0 +1,82 @@
+from async_db import db
+from cache import TTLCache
+from config import config
+import time
+
+# Cached for users with no persisted session, so their DMs don't each query SQLite
+NO_SESSION = object()
+
+
+class UserSession:
+    __slots__ = ('state', 'data', 'profile', 'touched_at')
+
+    def __init__(self, state=None, data=None, profile=None, touched_at=None):
+        self.state = state
+        self.data = data  # (flagged message content, flagged categories)
+        self.profile = profile  # Music profile answers; None until the user starts the wizard
+        self.touched_at = touched_at or time.time()
+
+    def reset(self, state=None, data=None):
+        self.state = state
+        self.data = data
+
+
+class SessionStore:
+    # Per-user DM conversation state. Sessions live in an LRU with an idle TTL so users who
+    # DM the bot once don't stay in memory forever, and sessions with a flow in progress are
+    # written through to SQLite so a restart doesn't drop a half-finished report or profile.
+    # A persisted session evicted from the LRU is read back from SQLite on its next use.
+    def __init__(self, states, maxsize=config.SESSION_MAX_SIZE, ttl=config.SESSION_TTL, persist=config.SESSION_PERSIST):
+        self.states = states  # The State enum, used to restore persisted states by name
+        self.ttl = ttl
+        self.persist = persist
+        self.sessions = TTLCache(maxsize, ttl)
+
+    async def load(self):
+        if not self.persist:
+            return 0
+        rows = await db.load_dm_sessions(int(time.time() - self.ttl), self.sessions.maxsize)
+        for row in reversed(rows):
+            self.restore(row)
+        print(f"Restored {len(rows)} DM sessions.")
+        return len(rows)
+
+    def restore(self, row):
+        user_id, state, data, profile, touched_at = row
+        state = self.states[state] if state in self.states.__members__ else None
+        data = tuple(data) if data else None
+        session = UserSession(state, data, profile, touched_at)
+        self.sessions.set(int(user_id), session, expires_at=touched_at + self.ttl)
+        return session
+
+    async def get(self, user_id):
+        session = self.sessions.get(user_id)
+        if session is None and self.persist:
+            row = await db.get_dm_session(user_id, int(time.time() - self.ttl))
+            if row:
+                session = self.restore(row)
+            else:
+                self.sessions.set(user_id, NO_SESSION)  # Until session() or save() stores a real one
+        return None if session is NO_SESSION else session
+
+    async def session(self, user_id):
+        session = await self.get(user_id)
+        if session is None:
+            session = UserSession()
+            self.sessions.set(user_id, session)
+        return session
+
+    async def save(self, user_id, session):
+        # Call after changing a session: refreshes its TTL and persists it
+        session.touched_at = time.time()
+        self.sessions.set(user_id, session)
+        if not self.persist:
+            return
+        if session.state is None:
+            await db.delete_dm_session(user_id)
+        else:
+            await db.save_dm_session(user_id, session.state.name, list(session.data) if session.data else None,
+                                     session.profile, int(session.touched_at))
+
+    def stats(self):
+        return self.sessions.stats()
@@ -0,0 +1,28 @@
+import asyncio
+
+
+class SingleFlight:
+    # Concurrent callers asking for the same key share one in-flight call and its result
+    def __init__(self):
+        self.in_flight = {}  # key -> future of the running call
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key, func, *args, **kwargs):
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            self.calls += 1
+            future = asyncio.ensure_future(func(*args, **kwargs))
+            self.in_flight[key] = future
+            future.add_done_callback(lambda done: self.in_flight.pop(key, None) if self.in_flight.get(key) is done else None)
+        # One impatient caller being cancelled must not cancel the call for everyone else
+        return await asyncio.shield(future)
+
+    def stats(self):
+        return {
+            'in_flight': len(self.in_flight),
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+        }
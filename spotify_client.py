@@ -0,0 +1,90 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+from http_pool import http_session
+from metrics import metrics
+import spotipy
+from config import config
+
+
+class PooledSpotify(spotipy.Spotify):
+    # spotipy closes its session when a client is garbage collected, which would drop
+    # every pooled connection; the shared session outlives any one client.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prefix = config.SPOTIFY_API_URL
+
+    def __del__(self):
+        pass
+
+
+class AsyncSpotifyClient:
+    # spotipy and requests are blocking, so every call is handed to a worker thread
+    # and awaited. This keeps the discord.py event loop free while Spotify responds.
+    def __init__(self, max_workers=config.SPOTIFY_MAX_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='spotify')
+
+    async def run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def client(self, access_token):
+        return PooledSpotify(auth=access_token, requests_session=http_session, requests_timeout=http_session.timeout)
+
+    async def call(self, access_token, method, *args, **kwargs):
+        def _call():
+            return getattr(self.client(access_token), method)(*args, **kwargs)
+        with metrics.timer('bot_external_call', service='spotify', operation=method):
+            return await self.run(_call)
+
+    async def get(self, url, **kwargs):
+        with metrics.timer('bot_external_call', service='http', operation='get'):
+            return await self.run(http_session.get, url, **kwargs)
+
+    async def current_user(self, access_token):
+        return await self.call(access_token, 'current_user')
+
+    async def current_user_playing_track(self, access_token):
+        return await self.call(access_token, 'current_user_playing_track')
+
+    async def current_user_top_tracks(self, access_token, limit=20):
+        return await self.call(access_token, 'current_user_top_tracks', limit=limit)
+
+    async def current_user_top_artists(self, access_token, limit=20):
+        return await self.call(access_token, 'current_user_top_artists', limit=limit)
+
+    async def current_user_playlists(self, access_token, limit=50):
+        return await self.call(access_token, 'current_user_playlists', limit=limit)
+
+    async def search(self, access_token, q, type='track', limit=10):
+        return await self.call(access_token, 'search', q=q, type=type, limit=limit)
+
+    async def track(self, access_token, track_id):
+        return await self.call(access_token, 'track', track_id)
+
+    async def tracks(self, access_token, track_ids):
+        return await self.call(access_token, 'tracks', track_ids)
+
+    async def albums(self, access_token, album_ids):
+        return await self.call(access_token, 'albums', album_ids)
+
+    async def artists(self, access_token, artist_ids):
+        return await self.call(access_token, 'artists', artist_ids)
+
+    async def playlist_items(self, access_token, playlist_id, limit=100, offset=0):
+        return await self.call(access_token, 'playlist_items', playlist_id, limit=limit, offset=offset, additional_types=('track',))
+
+    async def album_tracks(self, access_token, album_id, limit=50, offset=0):
+        return await self.call(access_token, 'album_tracks', album_id, limit=limit, offset=offset)
+
+    async def playlist_add_items(self, access_token, playlist_id, items):
+        return await self.call(access_token, 'playlist_add_items', playlist_id=playlist_id, items=items)
+
+    async def user_playlist_create(self, access_token, user, name, public=True, description=''):
+        return await self.call(access_token, 'user_playlist_create', user=user, name=name, public=public, description=description)
+
+    async def playlist_change_details(self, access_token, playlist_id, **kwargs):
+        return await self.call(access_token, 'playlist_change_details', playlist_id=playlist_id, **kwargs)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,11 @@
+import asyncio
+
+
+def spawn(coro, tasks):
+    # Starts a fire-and-forget task and keeps it in `tasks` until it finishes. The event loop
+    # only holds weak references to tasks, so one nobody references can be garbage collected
+    # before it completes.
+    task = asyncio.create_task(coro)
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+    return task
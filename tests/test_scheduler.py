@@ -0,0 +1,62 @@
+import asyncio
+from datetime import datetime
+import os
+import sys
+import tempfile
+import unittest
+
+# database_setup opens spotify_tokens.db in the working directory on import
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+os.chdir(tempfile.mkdtemp(prefix='tunein_bot_test_'))
+
+from async_db import db
+from scheduler import Scheduler
+
+
+class SchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await db.initialize()
+        self.scheduler = Scheduler()
+
+    async def asyncTearDown(self):
+        self.scheduler.stop()
+
+    async def test_reregister_while_running_keeps_running(self):
+        started = asyncio.Event()
+        release = asyncio.Event()
+        calls = []
+
+        async def tick():
+            calls.append(len(calls))
+            if len(calls) == 1:
+                started.set()
+                await release.wait()
+
+        await self.scheduler.register('tick', tick, interval=0.05)
+        self.scheduler.start()
+        await asyncio.wait_for(started.wait(), 2)
+
+        # e.g. on_ready firing again after a reconnect while the first run is still going
+        job = await self.scheduler.register('tick', tick, interval=0.05)
+        release.set()
+        await asyncio.sleep(0.3)
+
+        self.assertIs(self.scheduler.jobs['tick'], job)
+        self.assertGreaterEqual(job.runs, 3)
+        self.assertGreaterEqual(len(calls), 3)
+
+    async def test_reregister_updates_timing(self):
+        async def noop():
+            pass
+
+        job = await self.scheduler.register('daily', noop, hour=3, minute=0)
+        again = await self.scheduler.register('daily', noop, hour=4, minute=30)
+        self.assertIs(again, job)
+        self.assertEqual((job.hour, job.minute), (4, 30))
+        next_run = datetime.fromtimestamp(job.next_run_at, job.timezone)
+        self.assertEqual((next_run.hour, next_run.minute), (4, 30))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import asyncio
+from config import config
+import heapq
+import logging
+import random
+from tasks import spawn
+import time
+
+
+class TokenRefresher:
+    # Renews tokens shortly before they expire so user commands almost never pay for a
+    # refresh. Due times live in a min-heap; entries made stale by a newer token are
+    # skipped when they reach the top.
+    def __init__(self, token_store, refresh, lead_time=config.TOKEN_REFRESH_LEAD_TIME, jitter=config.TOKEN_REFRESH_JITTER,
+                 concurrency=config.TOKEN_REFRESH_CONCURRENCY, retry_delay=config.TOKEN_REFRESH_RETRY_DELAY):
+        self.token_store = token_store
+        self.refresh = refresh  # async (token_info, user_id) -> access token or None
+        self.lead_time = lead_time
+        self.jitter = jitter
+        self.retry_delay = retry_delay
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.heap = []  # (due_at, expires_at, user_id)
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.refreshing = set()  # refresh_one tasks in flight
+        self.refreshed = 0
+        self.failed = 0
+        token_store.listeners.append(self.schedule)
+
+    def schedule(self, record, due_at=None):
+        if not record.expires_at or not record.refresh_token:
+            return
+        if due_at is None:
+            due_at = record.expires_at - self.lead_time - random.uniform(0, self.jitter)
+        heapq.heappush(self.heap, (due_at, record.expires_at, record.user_id))
+        self.wakeup.set()
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            now = time.time()
+            while self.heap and self.heap[0][0] <= now:
+                _, expires_at, user_id = heapq.heappop(self.heap)
+                record = self.token_store.records.get(user_id)
+                if not record or record.expires_at != expires_at:
+                    continue
+                await self.semaphore.acquire()
+                spawn(self.refresh_one(record), self.refreshing)
+            timeout = self.heap[0][0] - time.time() if self.heap else None
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def refresh_one(self, record):
+        expires_at = record.expires_at
+        try:
+            access_token = await self.refresh(record, record.user_id)
+        except Exception as e:
+            logging.error(f"Background token refresh failed for user {record.user_id}: {e}")
+            access_token = None
+        finally:
+            self.semaphore.release()
+
+        if access_token:
+            self.refreshed += 1
+        else:
+            self.failed += 1
+            # Try again later unless the token changed under us or has already run out
+            if record.expires_at == expires_at and time.time() + self.retry_delay < expires_at:
+                self.schedule(record, due_at=time.time() + self.retry_delay)
+
+    def near_expiry_count(self, window=None):
+        cutoff = time.time() + (self.lead_time if window is None else window)
+        return sum(1 for record in self.token_store.records.values() if record.expires_at and record.expires_at <= cutoff)
+
+    def stats(self):
+        return {
+            'scheduled': len(self.heap),
+            'near_expiry': self.near_expiry_count(),
+            'refreshed': self.refreshed,
+            'failed': self.failed,
+        }
@@ -0,0 +1,112 @@
+from async_db import db
+from config import config
+from flash_server import get_token, save_token
+import time
+
+
+class TokenRecord:
+    __slots__ = ('user_id', 'access_token', 'refresh_token', 'token_type', 'expires_in', 'scope', 'expires_at')
+
+    def __init__(self, user_id, access_token=None, refresh_token=None, token_type='Bearer', expires_in=3600, scope='', expires_at=None):
+        self.user_id = user_id
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+        self.token_type = token_type
+        self.expires_in = expires_in
+        self.scope = scope
+        self.expires_at = expires_at
+
+    @classmethod
+    def from_row(cls, token):
+        return cls(token.user_id, token.access_token, token.refresh_token, token.token_type, token.expires_in, token.scope, token.expires_at)
+
+    def update(self, token_info):
+        # Same rules as save_token: fields missing from token_info keep their old value
+        for field in ('access_token', 'refresh_token', 'token_type', 'expires_in', 'scope', 'expires_at'):
+            if field in token_info:
+                setattr(self, field, token_info[field])
+
+    def __repr__(self):
+        return f"<TokenRecord(user_id='{self.user_id}', expires_at={self.expires_at})>"
+
+
+class TokenStore:
+    # Keeps every user's Spotify token in memory so commands never touch the database on
+    # the hot path. Updates are applied in memory first, then written through to SQLite.
+    def __init__(self, miss_ttl=config.TOKEN_STORE_MISS_TTL, reauth_window=config.TOKEN_STORE_REAUTH_WINDOW):
+        self.records = {}  # user_id -> TokenRecord
+        self.missing = {}  # user_id -> time until which we trust that the user has no token
+        self.read_through = {}  # user_id -> time until which lookups go to the database
+        self.miss_ttl = miss_ttl
+        self.reauth_window = reauth_window
+        self.listeners = []  # Called with a TokenRecord whenever one is loaded or updated
+        self.db_reads = 0
+        self.db_writes = 0
+
+    def notify(self, record):
+        for listener in self.listeners:
+            listener(record)
+
+    async def load(self):
+        tokens = await db.fetch_all_tokens()
+        self.db_reads += 1
+        self.records = {token.user_id: TokenRecord.from_row(token) for token in tokens}
+        self.missing.clear()
+        for record in self.records.values():
+            self.notify(record)
+        print(f"Loaded {len(self.records)} Spotify tokens.")
+
+    async def get(self, user_id):
+        user_id = str(user_id)
+        now = time.time()
+        record = self.records.get(user_id)
+        if record and self.read_through.get(user_id, 0) <= now:
+            return record
+        if not record and self.missing.get(user_id, 0) > now:
+            return None
+
+        # Users can authenticate through flash_server at any time, so a miss is checked
+        # against the database before we believe it.
+        token = await db.run(get_token, user_id)
+        self.db_reads += 1
+        if token:
+            self.missing.pop(user_id, None)
+            record = TokenRecord.from_row(token)
+            self.records[user_id] = record
+            self.notify(record)
+            return record
+        self.missing[user_id] = now + self.miss_ttl
+        return self.records.get(user_id)
+
+    async def save(self, user_id, token_info):
+        user_id = str(user_id)
+        record = self.records.get(user_id)
+        if record and record.expires_at and token_info.get('expires_at', record.expires_at) < record.expires_at:
+            # A newer token has already been stored; don't let a late write roll it back
+            return record
+        if record:
+            record.update(token_info)
+        else:
+            record = TokenRecord(user_id)
+            record.update(token_info)
+            self.records[user_id] = record
+        self.missing.pop(user_id, None)
+        self.notify(record)
+        await db.run(save_token, user_id, token_info)
+        self.db_writes += 1
+        return record
+
+    def expect_reauthentication(self, user_id):
+        # flash_server writes the new token straight to the database after /authenticate
+        user_id = str(user_id)
+        self.missing.pop(user_id, None)
+        self.read_through[user_id] = time.time() + self.reauth_window
+
+    def user_ids(self):
+        # Includes users who just re-authenticated and whose token get() hasn't read back yet
+        now = time.time()
+        recent = [user_id for user_id, until in self.read_through.items() if until > now and user_id not in self.records]
+        return list(self.records) + recent
+
+    def __len__(self):
+        return len(self.records)
@@ -0,0 +1,82 @@
+from async_db import db
+import asyncio
+from config import config
+import re
+
+OPTION_LINE = re.compile(r'^\(?([A-Da-d])[).:\-]\s*(.+)$')
+ANSWER = re.compile(r'^\W*([A-Da-d])\b')
+
+
+def parse_trivia(text):
+    # Returns (question, options, answer) or None unless the reply has a question, exactly
+    # the options A-D once each, and a "Correct:" letter that is one of them
+    if 'Correct:' not in text:
+        return None
+    question_part, answer_part = text.rsplit('Correct:', 1)
+    stem = []
+    options = {}
+    for line in question_part.strip().splitlines():
+        line = line.strip()
+        match = OPTION_LINE.match(line)
+        if match:
+            letter = match.group(1).upper()
+            if letter in options:
+                return None
+            options[letter] = f"{letter}) {match.group(2).strip()}"
+        elif line and not options:
+            stem.append(line)
+    answer = ANSWER.match(answer_part.strip())
+    if not stem or sorted(options) != ['A', 'B', 'C', 'D'] or not answer:
+        return None
+    if len({option[3:].casefold() for option in options.values()}) != 4:
+        return None
+    options = [options[letter] for letter in 'ABCD']
+    return '\n'.join(stem + options), options, answer.group(1).upper()
+
+
+def trivia_key(question):
+    stem = [line for line in question.splitlines() if not OPTION_LINE.match(line.strip())]
+    return ' '.join(re.sub(r'[^\w\s]', ' ', ' '.join(stem).casefold()).split())
+
+
+class TriviaPool:
+    # Questions generated and validated ahead of time and kept in SQLite, so the daily post
+    # is a local read. Refills in the background whenever the pool runs low.
+    def __init__(self, generate, low_watermark=config.TRIVIA_POOL_LOW_WATERMARK, target=config.TRIVIA_POOL_TARGET):
+        self.generate = generate  # async () -> (question, options, answer), or Nones on failure
+        self.low_watermark = low_watermark
+        self.target = target
+        self.refill_task = None
+        self.generated = 0
+        self.rejected = 0
+        self.duplicates = 0
+
+    def refill_in_background(self):
+        if self.refill_task is None or self.refill_task.done():
+            self.refill_task = asyncio.create_task(self.refill())
+
+    async def refill(self):
+        count = await db.count_unused_trivia_questions()
+        if count >= self.low_watermark:
+            return
+        attempts = 0
+        while count < self.target and attempts < self.target * 3:
+            attempts += 1
+            question, options, answer = await self.generate()
+            if not question:
+                self.rejected += 1
+                continue
+            if await db.add_trivia_question(trivia_key(question), question, options, answer):
+                self.generated += 1
+                count += 1
+            else:
+                self.duplicates += 1
+        print(f"Trivia pool refilled to {count} questions.")
+
+    async def take(self):
+        trivia = await db.take_trivia_question()
+        self.refill_in_background()
+        return trivia
+
+    def stats(self):
+        return {'generated': self.generated, 'rejected': self.rejected, 'duplicates': self.duplicates}